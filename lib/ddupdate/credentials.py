@@ -0,0 +1,75 @@
+"""
+Bulk import and export of credentials.
+
+Credentials are handled as (machine, username, password) tuples, where
+username might be None for services only using an api key. Two formats
+are supported:
+
+  - CSV with machine, username and password columns. A first line with
+    these column names is optional.
+  - JSON, a list of objects with machine, username and password keys.
+
+"""
+
+import csv
+import io
+import json
+
+FIELDS = ['machine', 'username', 'password']
+
+
+class CredentialsError(Exception):
+    """Malformed credentials data."""
+
+
+def _check(machine, username, password):
+    """Return a validated credentials tuple."""
+    if not machine or not password:
+        raise CredentialsError("Missing machine or password")
+    return machine, username if username else None, password
+
+
+def _from_json(text):
+    """Parse JSON credentials text."""
+    try:
+        items = json.loads(text)
+        return [_check(item['machine'], item.get('username'),
+                       item['password'])
+                for item in items]
+    except (ValueError, KeyError, TypeError, AttributeError) as err:
+        raise CredentialsError("Bad JSON credentials: %s" % err) from None
+
+
+def _from_csv(text):
+    """Parse CSV credentials text."""
+    credentials = []
+    reader = csv.reader(io.StringIO(text))
+    for row in reader:
+        if not row or row == FIELDS:
+            continue
+        if len(row) != 3:
+            raise CredentialsError(
+                "Bad CSV credentials at line %d" % reader.line_num)
+        credentials.append(_check(*row))
+    return credentials
+
+
+def read_credentials(f):
+    """Return list of credentials read from file object f, any format."""
+    text = f.read()
+    if text.lstrip().startswith('['):
+        return _from_json(text)
+    return _from_csv(text)
+
+
+def write_credentials(f, credentials, fmt='csv'):
+    """Write credentials to file object f using fmt 'csv' or 'json'."""
+    if fmt == 'json':
+        items = [dict(zip(FIELDS, c)) for c in credentials]
+        json.dump(items, f, indent=1)
+        f.write('\n')
+    else:
+        writer = csv.writer(f)
+        writer.writerow(FIELDS)
+        for machine, username, password in credentials:
+            writer.writerow([machine, username or '', password])
@@ -0,0 +1,287 @@
+"""
+Long-running ddupdate service, see --daemon in ddupdate(8).
+
+Each configuration section is checked on its own interval, scheduled
+using a monotonic clock. Plugins and their in-memory caches are kept
+between checks, so a check costs just the address lookup and possibly
+an update.
+
+The daemon listens on a Unix domain control socket. A client sends a
+single line with a command and its arguments separated by whitespace.
+The reply starts with a line 'OK' or 'ERROR <message>', possibly
+followed by more lines, and ends when the daemon closes the connection.
+"""
+
+import errno
+import fcntl
+import os
+import selectors
+import signal
+import socket
+import time
+
+
+class Scheduler:
+    """
+    Keeps track of when each section is due for a check.
+
+    busy is True while handling control commands received during a run.
+    """
+
+    def __init__(self, intervals):
+        """Create scheduler for sections dict name -> interval seconds."""
+        self.intervals = {}
+        self.due = {}
+        self.busy = False
+        self.update(intervals)
+
+    def update(self, intervals):
+        """
+        Replace the scheduled sections, e. g., after a configuration reload.
+
+        New sections are due now. Existing ones keep their due time, but
+        are checked no later than their new interval from now.
+        """
+        now = time.monotonic()
+        self.due = {s: min(self.due.get(s, now), now + interval)
+                    for s, interval in intervals.items()}
+        self.intervals = dict(intervals)
+
+    def trigger(self, sections, delay=0):
+        """Make sections due in delay seconds, unless due earlier."""
+        due = time.monotonic() + delay
+        for section in sections:
+            self.due[section] = min(self.due[section], due)
+
+    def due_sections(self, now):
+        """Return list of sections due at monotonic time now."""
+        return [s for s in self.intervals if self.due[s] <= now]
+
+    def reschedule(self, sections, now, intervals=None):
+        """
+        Schedule next check of sections after monotonic time now.
+
+        intervals is an optional dict section -> seconds overriding the
+        configured intervals.
+        """
+        intervals = intervals if intervals else {}
+        for section in sections:
+            self.due[section] = \
+                now + intervals.get(section, self.intervals[section])
+
+    def timeout(self, now):
+        """Return seconds until next section is due, or None if none."""
+        if not self.due:
+            return None
+        return max(min(self.due.values()) - now, 0)
+
+
+class ControlError(Exception):
+    """Error reported to a control socket client."""
+
+
+def _check_stale(path):
+    """
+    Remove socket file path if no one is listening on it.
+
+    Raises:
+      - OSError, errno EADDRINUSE if path is or might be in use.
+
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(2)
+        try:
+            sock.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            return
+        except OSError as err:
+            raise OSError(errno.EADDRINUSE,
+                          "Control socket busy: " + str(err)) from None
+    raise OSError(errno.EADDRINUSE, "Another daemon is running")
+
+
+def open_control_socket(path):
+    """
+    Return a (socket, lock file) tuple with a socket listening on path.
+
+    The lock file path.lock is locked until closed, at most one daemon
+    can hold it. A stale socket file is removed. The socket is only
+    accessible by the current user.
+
+    Raises:
+      - OSError if the socket cannot be created, errno EADDRINUSE if
+        another daemon is running.
+
+    """
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    fd = os.open(path + '.lock', os.O_WRONLY | os.O_CREAT, 0o600)
+    lock_file = os.fdopen(fd, 'w')
+    try:
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise OSError(errno.EADDRINUSE,
+                          "Another daemon is running") from None
+        if os.path.exists(path):
+            _check_stale(path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o077)
+        try:
+            sock.bind(path)
+        except OSError:
+            sock.close()
+            raise
+        finally:
+            os.umask(old_umask)
+    except OSError:
+        lock_file.close()
+        raise
+    sock.listen()
+    sock.setblocking(False)
+    return sock, lock_file
+
+
+def send_command(path, words, timeout=10):
+    """
+    Send command words to daemon listening on path, return reply text.
+
+    Raises:
+      - OSError if there is no daemon or it doesn't reply in time.
+
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall((' '.join(words) + '\n').encode('utf-8'))
+        chunks = []
+        while True:
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return b''.join(chunks).decode('utf-8')
+
+
+def _handle_client(log, sock, scheduler, commands):
+    """Read one command from connected sock, run it and send reply."""
+    try:
+        sock.settimeout(2)
+        request = b''
+        while b'\n' not in request and len(request) < 4096:
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            request += chunk
+        words = request.decode('utf-8', 'replace').split()
+        log.debug("Control command: %s", ' '.join(words))
+        try:
+            if not words or words[0] not in commands:
+                raise ControlError(
+                    "Unknown command, use one of: "
+                    + ' '.join(sorted(commands)))
+            reply = 'OK\n' + commands[words[0]](scheduler, words[1:])
+        except ControlError as err:
+            reply = 'ERROR %s\n' % err
+        sock.sendall(reply.encode('utf-8'))
+    except OSError as err:
+        log.warning("Control connection error: %s", err)
+    finally:
+        sock.close()
+
+
+def _handle_queued(log, control, scheduler):
+    """Handle commands queued during a run, with scheduler.busy set."""
+    scheduler.busy = True
+    try:
+        while True:
+            try:
+                client = control[0].accept()[0]
+            except BlockingIOError:
+                return
+            _handle_client(log, client, scheduler, control[1])
+    finally:
+        scheduler.busy = False
+
+
+def serve(log, load, run, control=None):
+    """
+    Run checks until terminated by SIGTERM or SIGINT.
+
+    Parameters:
+      - log: Standard python log instance.
+      - load: function returning a dict section name -> check interval
+        in seconds, in configuration order. Invoked on startup and on
+        SIGHUP; returning None on SIGHUP keeps the current schedule.
+      - run: function run(sections, first) checking and updating a list
+        of section names. first is True for the initial run. Returns
+        a dict section -> seconds to next check, or None to use the
+        intervals from load().
+      - control: optional (socket, commands) tuple. socket is a listening
+        socket from open_control_socket(). commands is a dict of command
+        name -> function(scheduler, args) returning the reply text after
+        the 'OK' line or raising ControlError.
+
+    """
+    scheduler = Scheduler(load())
+    received = set()
+
+    def on_signal(signum, frame):
+        # pylint: disable=unused-argument
+        received.add(signum)
+
+    wakeup_r, wakeup_w = socket.socketpair()
+    wakeup_r.setblocking(False)
+    wakeup_w.setblocking(False)
+    old_wakeup_fd = signal.set_wakeup_fd(wakeup_w.fileno())
+    old_handlers = {signum: signal.signal(signum, on_signal)
+                    for signum in [signal.SIGTERM, signal.SIGINT,
+                                   signal.SIGHUP]}
+    selector = selectors.DefaultSelector()
+    selector.register(wakeup_r, selectors.EVENT_READ)
+    if control:
+        selector.register(control[0], selectors.EVENT_READ)
+    log.info("Running as daemon, %d section(s)", len(scheduler.intervals))
+    first = True
+    try:
+        while not received & {signal.SIGTERM, signal.SIGINT}:
+            if signal.SIGHUP in received:
+                received.discard(signal.SIGHUP)
+                intervals = load()
+                if intervals is not None:
+                    log.info("Configuration reloaded")
+                    scheduler.update(intervals)
+            due = scheduler.due_sections(time.monotonic())
+            if due:
+                next_checks = run(due, first)
+                first = False
+                scheduler.reschedule(due, time.monotonic(), next_checks)
+                if control:
+                    _handle_queued(log, control, scheduler)
+                continue
+            timeout = scheduler.timeout(time.monotonic())
+            log.debug("Sleeping %s seconds", timeout)
+            for key, _ in selector.select(timeout):
+                if key.fileobj is wakeup_r:
+                    try:
+                        while wakeup_r.recv(64):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                try:
+                    client = control[0].accept()[0]
+                except BlockingIOError:
+                    continue
+                _handle_client(log, client, scheduler, control[1])
+        log.info("Terminating on signal")
+    finally:
+        signal.set_wakeup_fd(old_wakeup_fd)
+        for signum, handler in old_handlers.items():
+            signal.signal(signum, handler)
+        selector.close()
+        wakeup_r.close()
+        wakeup_w.close()
@@ -19,6 +19,12 @@ The module also provides some utility functions used in plugins.
 """
 
 import inspect
+import ipaddress
+import json
+import os
+import os.path
+import tempfile
+import warnings
 
 import urllib.request
 from urllib.parse import urlencode, urlparse
@@ -43,6 +49,72 @@ def get_auth_plugin():
     """Return actual AuthPlugin used."""
     return auth_plugin
 
+
+# All loaded AddressPlugins keyed by name, used by plugins combining others.
+address_plugins = {}
+
+
+def set_address_plugins(plugins):
+    """Define the available AddressPlugins, a dict keyed by name."""
+    # pylint: disable=global-statement
+    global address_plugins
+    address_plugins = plugins
+
+
+def get_address_plugin(name):
+    """Return AddressPlugin with given name or None."""
+    return address_plugins.get(name)
+
+
+# Directory where plugins can keep data between runs, see read_plugin_cache()
+cache_dir = None
+
+
+def set_cache_dir(path):
+    """Define the directory used by read/write_plugin_cache()."""
+    # pylint: disable=global-statement
+    global cache_dir
+    cache_dir = path
+
+
+def get_cache_dir():
+    """Return directory where plugins can store cached data, or None."""
+    return cache_dir
+
+
+def read_plugin_cache(name):
+    """
+    Return data stored using write_plugin_cache(name, ...).
+
+    Returns an empty dict if there is no or unreadable data. The cache is
+    just an optimization, callers must handle stale data.
+    """
+    if not cache_dir:
+        return {}
+    try:
+        with open(os.path.join(cache_dir, name + '.json')) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def write_plugin_cache(name, data):
+    """Atomically store the json-serializable dict data under name."""
+    if not cache_dir:
+        return
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix=name, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, os.path.join(cache_dir, name + '.json'))
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
 # pylint: disable=duplicate-code
 
 
@@ -71,7 +143,8 @@ def dict_of_opts(options):
     Convert list of plugin options from the arg_parser to a dict.
 
     Single keyword options are inserted as dict[keyword] = True,
-    key=val options are inserted as dict[key] = val.
+    key=val options are inserted as dict[key] = val. The value might
+    itself contain '=' characters, like in an url.
 
     """
     if not options:
@@ -79,13 +152,35 @@ def dict_of_opts(options):
     result = {}
     for opt in options:
         if '=' in opt:
-            key, value = opt.split('=')
+            key, value = opt.split('=', 1)
             result[key] = value
         else:
             result[opt] = True
     return result
 
 
+def split_host_port(server, default_port):
+    """
+    Split a 'host:port' string into a (host, port) tuple.
+
+    Parameters:
+      - server: string, 'host', 'host:port', 'ipv6 address' or
+        '[ipv6 address]:port'.
+      - default_port: int, port used if not present in server.
+    Raises:
+      - ValueError if the port is not a number.
+
+    """
+    if server.startswith('['):
+        host, _, port = server[1:].partition(']')
+        port = port.lstrip(':')
+    elif server.count(':') == 1:
+        host, port = server.split(':')
+    else:
+        host, port = server, ''
+    return host, int(port) if port else default_port
+
+
 def get_response(log, url, **kwargs):
     """
     Get data from server at given url.
@@ -141,8 +236,30 @@ def get_netrc_auth(machine):
     return auth_plugin.get_auth(machine.lower())
 
 
+def _parse_address(address, version):
+    """Return ipaddress object for address string of given version or None."""
+    if address is None or address == '':
+        return None
+    try:
+        addr = ipaddress.ip_address(address)
+    except ValueError:
+        raise AddressError("Bad ip address: %s" % address) from None
+    if addr.version != version:
+        raise AddressError(
+            "Not an ipv%d address: %s" % (version, address))
+    return addr
+
+
 class IpAddr:
-    """A (ipv4, ipv6) container."""
+    """
+    An immutable (ipv4, ipv6) container.
+
+    Addresses are validated and kept as ipaddress objects, the v4 and
+    v6 attributes returns them as canonical strings or None. Instances
+    are hashable and could be used as dict keys.
+    """
+
+    __slots__ = ('_v4', '_v6')
 
     def __init__(self, ipv4=None, ipv6=None):
         """
@@ -151,29 +268,70 @@ class IpAddr:
         Parameters:
           - ipv4: string, the ipv4 address in dotted notation.
           - ipv6: string, the ipv6 address in colon-hex notation.
+        Raises:
+          - AddressError if an address is invalid.
 
         """
-        self.v4 = ipv4
-        self.v6 = ipv6
+        object.__setattr__(self, '_v4', _parse_address(ipv4, 4))
+        object.__setattr__(self, '_v6', _parse_address(ipv6, 6))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("IpAddr is immutable")
+
+    @property
+    def v4(self):
+        """The ipv4 address as a string, or None."""
+        return str(self._v4) if self._v4 else None
+
+    @property
+    def v6(self):
+        """The ipv6 address as a string, or None."""
+        return str(self._v6) if self._v6 else None
 
     def __str__(self):
         return repr([self.v4, self.v6])
 
+    def __repr__(self):
+        return 'IpAddr(%r, %r)' % (self.v4, self.v6)
+
     def __eq__(self, obj):
         if not isinstance(obj, IpAddr):
             return False
-        return obj.v4 == self.v4 and obj.v6 == self.v6
+        # pylint: disable=protected-access
+        return obj._v4 == self._v4 and obj._v6 == self._v6
 
     def __hash__(self):
-        return hash(self.v4, self.v6)
+        return hash((self._v4, self._v6))
 
     def empty(self):
         """Check if any address is set."""
-        return self.v4 is None and self.v6 is None
+        return self._v4 is None and self._v6 is None
+
+    def filtered(self, ip_version):
+        """Return copy with addresses matching 'v4', 'v6' or 'all'."""
+        return IpAddr(self._v4 if ip_version in ['v4', 'all'] else None,
+                      self._v6 if ip_version in ['v6', 'all'] else None)
 
     def parse_ifconfig_output(self, text):
         """
-        Update v4 and v6 attributes by parsing ifconfig(8) or ip(8) output.
+        Update addresses by parsing ifconfig(8) or ip(8) output.
+
+        Deprecated, use IpAddr.from_ifconfig_output(). Kept for plugins
+        written against older versions. Since the object is modified, it
+        must not be used as a dict key or set member before this call.
+        """
+        warnings.warn("parse_ifconfig_output() is deprecated, use"
+                      " IpAddr.from_ifconfig_output()",
+                      DeprecationWarning, stacklevel=2)
+        ip = IpAddr.from_ifconfig_output(text)
+        # pylint: disable=protected-access
+        object.__setattr__(self, '_v4', ip._v4)
+        object.__setattr__(self, '_v6', ip._v6)
+
+    @staticmethod
+    def from_ifconfig_output(text):
+        """
+        Return IpAddr by parsing ifconfig(8) or ip(8) output.
 
         Parameters:
           - text: string, ifconfig <dev> or ip address show dev <dev> output.
@@ -181,13 +339,17 @@ class IpAddr:
           - AddressError if no address can be found in text
 
         """
+        v4 = None
+        v6 = None
         for line in text.split('\n'):
             words = [word for word in line.split(' ') if word != '']
+            if not words:
+                continue
             if words[0] == 'inet':
                 # use existing logic
-                self.v4 = words[1].split('/')[0]
+                v4 = words[1].split('/')[0]
             elif words[0] == 'inet6':
-                if self.v6:
+                if v6:
                     # stop if we already have an address
                     continue
                 addr = words[1].split('/')[0]
@@ -198,9 +360,10 @@ class IpAddr:
                 if 'deprecated' in words:
                     # don't use a "deprecated" address
                     continue
-                self.v6 = addr
-        if self.empty():
+                v6 = addr
+        if v4 is None and v6 is None:
             raise AddressError("Cannot find address for %s, giving up" % text)
+        return IpAddr(v4, v6)
 
 
 class AddressError(Exception):
@@ -294,6 +457,8 @@ class ServicePlugin(AbstractPlugin):
     """Abstract plugin doing the actual update work using a service."""
 
     _ip_cache_ttl = 120    # 2 hours, address cache timeout
+    _partial_update = False
+    _batch_update = False
 
     def __init__(self):
         """Default, empty constructor."""
@@ -303,6 +468,15 @@ class ServicePlugin(AbstractPlugin):
         """Return time when ip cache expires, in minutes from creation."""
         return self._ip_cache_ttl
 
+    def partial_update(self):
+        """
+        Return True if plugin can update ipv4 and ipv6 independently.
+
+        If so, register() is invoked with only the changed address(es)
+        set in the ip argument, leaving the other one untouched.
+        """
+        return self._partial_update
+
     def register(self, log, hostname, ip, options):
         """
         Do the actual update.
@@ -310,7 +484,7 @@ class ServicePlugin(AbstractPlugin):
         Parameters:
         - log: Standard python log instance
         - hostname: string, the DNS name to register
-        - ip: IpAddr, address to register
+        - ip: IpAddr, address to register. See partial_update().
         - opts: List of --service-option values.
 
         Raises:
@@ -319,6 +493,56 @@ class ServicePlugin(AbstractPlugin):
         """
         raise NotImplementedError("Attempt to invoke abstract register()")
 
+    def auth_machines(self, hostname, options):
+        """
+        Return list of credential machine names used by register().
+
+        Parameters:
+        - hostname: string, the DNS name to register
+        - options: List of --service-option values.
+
+        Used to prefetch credentials, see AuthPlugin.prefetch(). The
+        default implementation returns an empty list, fine for plugins
+        not using any credentials.
+        """
+        # pylint: disable=unused-argument
+        return []
+
+    def batch_update(self):
+        """
+        Return True if register_batch() should be used.
+
+        If so, updates from all configuration sections using this plugin
+        are collected and registered in one register_batch() call.
+        """
+        return self._batch_update
+
+    def register_batch(self, log, updates):
+        """
+        Register several hosts, possibly using fewer service requests.
+
+        Parameters:
+        - log: Standard python log instance
+        - updates: list of (hostname, ip, options) tuples, each one
+          with arguments as for register().
+
+        Returns:
+        - List with one item for each update, None if OK or else
+          the ServiceError or AuthError.
+
+        Raises:
+        - ServiceError or AuthError if all updates failed.
+
+        """
+        results = []
+        for hostname, ip, options in updates:
+            try:
+                self.register(log, hostname, ip, options)
+                results.append(None)
+            except (ServiceError, AuthError) as err:
+                results.append(err)
+        return results
+
 
 class AuthPlugin(AbstractPlugin):
     """Abstract plugin for managing credentials for a hostname."""
@@ -336,6 +560,23 @@ class AuthPlugin(AbstractPlugin):
         """
         raise NotImplementedError("Attempt to invoke abstract get_auth()")
 
+    def prefetch(self, log, machines, ttl=None):
+        """
+        Prepare for get_auth() calls, default implementation does nothing.
+
+        Invoked once when a run starts, before processing any section.
+        Plugins can use it to retrieve all credentials in one go.
+
+        Parameters:
+          - log: Standard python log instance.
+          - machines: list of machine names needed by the sections in
+            this run, see ServicePlugin.auth_machines().
+          - ttl: float, seconds until the next run in daemon mode, or
+            None. Plugins caching credentials in memory should keep
+            them at least this long.
+
+        """
+
     def set_password(self, machine, username, password):
         """
         Set username/password credentials for a machine.
@@ -349,3 +590,37 @@ class AuthPlugin(AbstractPlugin):
 
         """
         raise NotImplementedError("Attempt to invoke abstract get_auth()")
+
+    def set_passwords(self, credentials):
+        """
+        Set several credentials at once.
+
+        Parameters:
+          - credentials: list of (machine, username, password) tuples
+            as for set_password().
+        Raises:
+          - AuthError if credentials cannot be stored.
+
+        The default implementation invokes set_password() for each
+        item. Plugins override it when the storage can be updated in
+        a single operation.
+        """
+        for machine, username, password in credentials:
+            self.set_password(machine, username, password)
+
+    def get_passwords(self, machines=None):
+        """
+        Return all stored credentials.
+
+        Parameters:
+          - machines: list of machine names known to be used, or None.
+            Plugins which cannot list their storage return credentials
+            for these only.
+        Returns:
+          - List of (machine, username, password) tuples. Username
+            might be None.
+        Raises:
+          - AuthError if the credentials cannot be listed.
+
+        """
+        raise AuthError("Plugin %s cannot list credentials" % self.name())
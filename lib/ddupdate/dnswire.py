@@ -0,0 +1,458 @@
+"""
+Minimal DNS wire format support used by plugins.
+
+Handles building and parsing plain DNS messages (RFC 1035) and sending
+them to a server over UDP, falling back to TCP when the reply is
+truncated. This is not a resolver: queries go to a given server.
+
+Also supports dynamic updates (RFC 2136) signed with TSIG (RFC 8945).
+"""
+
+import base64
+import hmac
+import ipaddress
+import os
+import os.path
+import re
+import socket
+import struct
+import time
+
+from ddupdate.ddplugin import split_host_port
+
+TYPE_A = 1
+TYPE_NS = 2
+TYPE_SOA = 6
+TYPE_TXT = 16
+TYPE_AAAA = 28
+TYPE_TSIG = 250
+TYPE_ANY = 255
+
+TYPES = {'A': TYPE_A, 'NS': TYPE_NS, 'SOA': TYPE_SOA, 'TXT': TYPE_TXT,
+         'AAAA': TYPE_AAAA, 'ANY': TYPE_ANY}
+
+CLASS_IN = 1
+CLASS_CH = 3
+CLASS_NONE = 254
+CLASS_ANY = 255
+
+CLASSES = {'IN': CLASS_IN, 'CH': CLASS_CH}
+
+OPCODE_QUERY = 0
+OPCODE_UPDATE = 5
+
+RCODES = ['NOERROR', 'FORMERR', 'SERVFAIL', 'NXDOMAIN', 'NOTIMP', 'REFUSED',
+          'YXDOMAIN', 'YXRRSET', 'NXRRSET', 'NOTAUTH', 'NOTZONE']
+
+FLAG_QR = 0x8000
+FLAG_TC = 0x0200
+FLAG_RD = 0x0100
+
+TSIG_ERRORS = {16: 'BADSIG', 17: 'BADKEY', 18: 'BADTIME', 22: 'BADTRUNC'}
+
+# TSIG algorithm names and corresponding hashlib digests.
+TSIG_ALGORITHMS = {
+    'hmac-md5.sig-alg.reg.int.': 'md5',
+    'hmac-sha1.': 'sha1',
+    'hmac-sha224.': 'sha224',
+    'hmac-sha256.': 'sha256',
+    'hmac-sha384.': 'sha384',
+    'hmac-sha512.': 'sha512',
+}
+
+# Algorithm numbers used in dnssec-keygen K*.private files.
+_KEYFILE_ALGORITHMS = {
+    '157': 'hmac-md5', '161': 'hmac-sha1', '162': 'hmac-sha224',
+    '163': 'hmac-sha256', '164': 'hmac-sha384', '165': 'hmac-sha512'
+}
+
+DNS_PORT = 53
+
+
+class DnsError(Exception):
+    """Malformed message or failed exchange."""
+
+
+def encode_name(name):
+    """Return wire format of a domain name, no compression."""
+    wire = b''
+    for label in name.rstrip('.').split('.'):
+        if not label:
+            continue
+        label = label.encode('idna') if not label.isascii() \
+            else label.encode('ascii')
+        if len(label) > 63:
+            raise DnsError("Label too long in " + name)
+        wire += bytes([len(label)]) + label
+    return wire + b'\0'
+
+
+def decode_name(data, offset):
+    """Return (name, next offset) for a possibly compressed name."""
+    labels = []
+    end = None
+    jumps = 0
+    while True:
+        if offset >= len(data):
+            raise DnsError("Truncated name")
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            if offset + 1 >= len(data) or jumps > 64:
+                raise DnsError("Bad name compression")
+            if end is None:
+                end = offset + 2
+            offset = (length & 0x3F) << 8 | data[offset + 1]
+            jumps += 1
+            continue
+        offset += 1
+        if length == 0:
+            break
+        labels.append(data[offset:offset + length].decode('ascii', 'replace'))
+        offset += length
+    return '.'.join(labels) + '.', end if end is not None else offset
+
+
+def canonical_name(name):
+    """Return lowercase, absolute version of a domain name."""
+    return name.lower().rstrip('.') + '.'
+
+
+class Record:
+    """A resource record, rdata kept in wire format."""
+
+    # pylint: disable=too-few-public-methods,too-many-arguments
+
+    def __init__(self, name, rtype, rclass=CLASS_IN, ttl=0, rdata=b''):
+        """Construct a record, rdata is wire format bytes."""
+        self.name = name
+        self.rtype = rtype
+        self.rclass = rclass
+        self.ttl = ttl
+        self.rdata = rdata
+
+    def __repr__(self):
+        return 'Record(%s, %d, %d, %d, %r)' % \
+            (self.name, self.rtype, self.rclass, self.ttl, self.rdata)
+
+    def to_wire(self):
+        """Return wire format."""
+        return encode_name(self.name) \
+            + struct.pack('!HHIH', self.rtype, self.rclass, self.ttl,
+                          len(self.rdata)) \
+            + self.rdata
+
+    def text(self):
+        """Return list of strings representing the rdata."""
+        if self.rtype == TYPE_A and len(self.rdata) == 4:
+            return [str(ipaddress.IPv4Address(self.rdata))]
+        if self.rtype == TYPE_AAAA and len(self.rdata) == 16:
+            return [str(ipaddress.IPv6Address(self.rdata))]
+        if self.rtype == TYPE_TXT:
+            strings = []
+            pos = 0
+            while pos < len(self.rdata):
+                length = self.rdata[pos]
+                strings.append(self.rdata[pos + 1:pos + 1 + length]
+                               .decode('utf-8', 'replace'))
+                pos += 1 + length
+            return strings
+        return [self.rdata.hex()]
+
+
+def address_rdata(address):
+    """Return (type, rdata) for an ipv4 or ipv6 address string."""
+    addr = ipaddress.ip_address(address)
+    return (TYPE_A if addr.version == 4 else TYPE_AAAA), addr.packed
+
+
+class Message:
+    """A DNS message: header, question and three record sections."""
+
+    def __init__(self, msg_id=None, flags=0):
+        """Construct an empty message, using a random id by default."""
+        self.id = msg_id if msg_id is not None \
+            else struct.unpack('!H', os.urandom(2))[0]
+        self.flags = flags
+        self.questions = []     # (name, type, class) tuples
+        self.answers = []
+        self.authority = []
+        self.additional = []
+        self.raw = None         # Wire format, if parsed.
+        self.tsig_offset = None  # Start of trailing TSIG record in raw.
+
+    @property
+    def rcode(self):
+        """Response code, 0 if ok."""
+        return self.flags & 0x000F
+
+    def rcode_text(self):
+        """Return symbolic response code."""
+        code = self.rcode
+        return RCODES[code] if code < len(RCODES) else str(code)
+
+    def to_wire(self):
+        """Return wire format."""
+        wire = struct.pack('!HHHHHH', self.id, self.flags,
+                           len(self.questions), len(self.answers),
+                           len(self.authority), len(self.additional))
+        for name, rtype, rclass in self.questions:
+            wire += encode_name(name) + struct.pack('!HH', rtype, rclass)
+        for record in self.answers + self.authority + self.additional:
+            wire += record.to_wire()
+        return wire
+
+    @staticmethod
+    def from_wire(data):
+        """Parse wire format, return Message. Raises DnsError."""
+        if len(data) < 12:
+            raise DnsError("Message too short")
+        header = struct.unpack('!HHHHHH', data[:12])
+        msg = Message(header[0], header[1])
+        msg.raw = data
+        offset = 12
+        try:
+            for _ in range(header[2]):
+                name, offset = decode_name(data, offset)
+                rtype, rclass = struct.unpack('!HH', data[offset:offset + 4])
+                msg.questions.append((name, rtype, rclass))
+                offset += 4
+            for section, count in [(msg.answers, header[3]),
+                                   (msg.authority, header[4]),
+                                   (msg.additional, header[5])]:
+                for _ in range(count):
+                    start = offset
+                    name, offset = decode_name(data, offset)
+                    rtype, rclass, ttl, length = \
+                        struct.unpack('!HHIH', data[offset:offset + 10])
+                    offset += 10
+                    rdata = data[offset:offset + length]
+                    if len(rdata) != length:
+                        raise DnsError("Truncated record")
+                    section.append(Record(name, rtype, rclass, ttl, rdata))
+                    offset += length
+        except struct.error as err:
+            raise DnsError("Truncated message") from err
+        if msg.additional and msg.additional[-1].rtype == TYPE_TSIG:
+            msg.tsig_offset = start
+        return msg
+
+
+def make_query(name, rtype, rclass=CLASS_IN, recursion=True):
+    """Return a query Message."""
+    msg = Message(flags=(OPCODE_QUERY << 11) | (FLAG_RD if recursion else 0))
+    msg.questions.append((name, rtype, rclass))
+    return msg
+
+
+def make_update(zone, rclass=CLASS_IN):
+    """
+    Return an empty UPDATE Message for zone.
+
+    In an update the questions holds the zone, answers are prerequisites
+    and authority the actual updates (RFC 2136, 2.3 - 2.5).
+    """
+    msg = Message(flags=OPCODE_UPDATE << 11)
+    msg.questions.append((zone, TYPE_SOA, rclass))
+    return msg
+
+
+def delete_rrset(name, rtype):
+    """Return update record deleting all records of rtype for name."""
+    return Record(name, rtype, CLASS_ANY, 0, b'')
+
+
+def _algorithm_name(algorithm):
+    """Return canonical TSIG algorithm name for e. g. hmac-sha256."""
+    algorithm = canonical_name(algorithm)
+    if algorithm == 'hmac-md5.':
+        return 'hmac-md5.sig-alg.reg.int.'
+    return algorithm
+
+
+class TsigKey:
+    """A TSIG key used to sign messages and verify replies."""
+
+    def __init__(self, name, algorithm, secret):
+        """Construct a key, secret is bytes. Raises DnsError."""
+        self.name = canonical_name(name)
+        self.algorithm = _algorithm_name(algorithm)
+        if self.algorithm not in TSIG_ALGORITHMS:
+            raise DnsError("Unsupported TSIG algorithm: " + algorithm)
+        self.secret = secret
+
+    @staticmethod
+    def from_file(path):
+        """
+        Read key from a file as used by nsupdate -k.
+
+        Handles both BIND key statements as created by tsig-keygen and
+        dnssec-keygen K*.private files. Raises DnsError.
+        """
+        try:
+            with open(path) as f:
+                text = f.read()
+            match = re.search(r'key\s+"?([^"\s{]+)"?\s*{(.*?)}', text, re.S)
+            if match:
+                name = match.group(1)
+                algorithm = re.search(
+                    r'algorithm\s+"?([^";\s]+)', match.group(2)).group(1)
+                secret = re.search(
+                    r'secret\s+"([^"]+)"', match.group(2)).group(1)
+            else:
+                name = os.path.basename(path)[1:].split('+')[0]
+                number = re.search(r'^Algorithm:\s*(\d+)', text, re.M)
+                algorithm = _KEYFILE_ALGORITHMS[number.group(1)]
+                secret = re.search(r'^Key:\s*(\S+)', text, re.M).group(1)
+            return TsigKey(name, algorithm, base64.b64decode(secret))
+        except (OSError, AttributeError, KeyError, ValueError) as err:
+            raise DnsError("Cannot read key file %s: %s" % (path, err)) \
+                from None
+
+    def _variables(self, time_signed, fudge, error=0, other=b''):
+        """Return TSIG variables part of signed data (RFC 8945, 4.3.3)."""
+        return encode_name(self.name) \
+            + struct.pack('!HI', CLASS_ANY, 0) \
+            + encode_name(self.algorithm) \
+            + struct.pack('!HIHHH', time_signed >> 32,
+                          time_signed & 0xFFFFFFFF, fudge, error, len(other)) \
+            + other
+
+    def _mac(self, data):
+        """Return the HMAC of data."""
+        return hmac.new(self.secret, data,
+                        TSIG_ALGORITHMS[self.algorithm]).digest()
+
+    def sign(self, msg, fudge=300):
+        """
+        Sign msg, return (wire, mac).
+
+        wire is the wire format of msg with a TSIG record appended, mac
+        is needed to verify() the reply.
+        """
+        time_signed = int(time.time())
+        wire = msg.to_wire()
+        mac = self._mac(wire + self._variables(time_signed, fudge))
+        rdata = encode_name(self.algorithm) \
+            + struct.pack('!HIHH', time_signed >> 32,
+                          time_signed & 0xFFFFFFFF, fudge, len(mac)) \
+            + mac + struct.pack('!HHH', msg.id, 0, 0)
+        record = Record(self.name, TYPE_TSIG, CLASS_ANY, 0, rdata)
+        wire = wire[:10] + struct.pack('!H', len(msg.additional) + 1) \
+            + wire[12:] + record.to_wire()
+        return wire, mac
+
+    def verify(self, reply, request_mac):
+        """Raise DnsError unless the parsed reply is properly signed."""
+        if reply.tsig_offset is None:
+            raise DnsError("Reply is not signed")
+        record = reply.additional[-1]
+        if canonical_name(record.name) != self.name:
+            raise DnsError("Reply signed with unknown key " + record.name)
+        try:
+            algorithm, pos = decode_name(record.rdata, 0)
+            high, low, fudge, size = \
+                struct.unpack('!HIHH', record.rdata[pos:pos + 10])
+            mac = record.rdata[pos + 10:pos + 10 + size]
+            pos += 10 + size
+            orig_id, error, length = \
+                struct.unpack('!HHH', record.rdata[pos:pos + 6])
+            other = record.rdata[pos + 6:pos + 6 + length]
+        except struct.error:
+            raise DnsError("Malformed TSIG record in reply") from None
+        if error:
+            raise DnsError("TSIG error: " + TSIG_ERRORS.get(error, str(error)))
+        if canonical_name(algorithm) != self.algorithm:
+            raise DnsError("Reply signed using " + algorithm)
+        raw = reply.raw[:reply.tsig_offset]
+        raw = struct.pack('!H', orig_id) + raw[2:10] \
+            + struct.pack('!H', len(reply.additional) - 1) + raw[12:]
+        time_signed = high << 32 | low
+        expected = self._mac(
+            struct.pack('!H', len(request_mac)) + request_mac + raw
+            + self._variables(time_signed, fudge, error, other))
+        if not hmac.compare_digest(mac, expected):
+            raise DnsError("Bad TSIG signature in reply")
+        if abs(time.time() - time_signed) > fudge:
+            raise DnsError("TSIG time outside of fudge window")
+
+
+def _recv_exactly(sock, count):
+    """Read exactly count bytes from a stream socket."""
+    data = b''
+    while len(data) < count:
+        chunk = sock.recv(count - len(data))
+        if not chunk:
+            raise DnsError("Connection closed by server")
+        data += chunk
+    return data
+
+
+def _exchange_tcp(wire, address, timeout):
+    """Send wire over TCP, return raw reply."""
+    with socket.create_connection(address[:2], timeout) as sock:
+        sock.sendall(struct.pack('!H', len(wire)) + wire)
+        length = struct.unpack('!H', _recv_exactly(sock, 2))[0]
+        return _recv_exactly(sock, length)
+
+
+def _exchange_udp(wire, address, family, msg_id, timeout):
+    """Send wire over UDP, return raw reply with matching id."""
+    with socket.socket(family, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(address)
+        sock.send(wire)
+        while True:
+            data = sock.recv(65535)
+            if len(data) >= 2 and struct.unpack('!H', data[:2])[0] == msg_id:
+                return data
+
+
+def resolve_server(server, family=0):
+    """
+    Return list of (family, sockaddr) for a server spec like host:port.
+
+    Raises DnsError if the server cannot be resolved.
+    """
+    try:
+        host, port = split_host_port(server, DNS_PORT)
+        infos = socket.getaddrinfo(host, port, family, socket.SOCK_DGRAM)
+    except (OSError, ValueError) as err:
+        raise DnsError("Cannot resolve server %s: %s" % (server, err)) \
+            from None
+    return [(info[0], info[4]) for info in infos]
+
+
+def exchange(msg, server, timeout=5, tcp=False, family=0, wire=None):
+    """
+    Send msg to server, return reply Message.
+
+    Parameters:
+      - msg: Message to send.
+      - server: string, host, host:port or [ipv6 address]:port.
+      - timeout: float, seconds to wait for reply.
+      - tcp: use TCP instead of UDP. UDP falls back to TCP if
+        the reply is truncated.
+      - family: socket.AF_INET or AF_INET6 to restrict the transport,
+        0 for any.
+      - wire: optional, precomputed wire format of msg.
+    Raises:
+      - DnsError on errors, including timeouts.
+
+    """
+    wire = wire if wire else msg.to_wire()
+    errors = []
+    for addr_family, address in resolve_server(server, family):
+        try:
+            if not tcp and len(wire) <= 512:
+                data = _exchange_udp(
+                    wire, address, addr_family, msg.id, timeout)
+                reply = Message.from_wire(data)
+                if not reply.flags & FLAG_TC:
+                    return reply
+            reply = Message.from_wire(_exchange_tcp(wire, address, timeout))
+            if reply.id != msg.id:
+                raise DnsError("Reply id mismatch")
+            return reply
+        except (OSError, DnsError) as err:
+            errors.append('%s: %s' % (address[0], err))
+    raise DnsError("No reply from %s (%s)" % (server, '; '.join(errors)))
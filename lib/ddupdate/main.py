@@ -1,9 +1,10 @@
 """Update DNS data for dynamic ip addresses."""
 
 import argparse
-import ast
 import configparser
+import fcntl
 import glob
+import hashlib
 import importlib
 import importlib.util
 import inspect
@@ -11,15 +12,21 @@ import logging
 import math
 import os
 import os.path
-import stat
+import socket
+import sqlite3
 import sys
 import time
 
 
+from ddupdate import daemon
 from ddupdate.ddplugin import AddressPlugin, AddressError
 from ddupdate.ddplugin import ServicePlugin, ServiceError, IpAddr
 from ddupdate.ddplugin import AuthPlugin, AuthError
 from ddupdate.ddplugin import set_auth_plugin, get_auth_plugin
+from ddupdate.ddplugin import set_address_plugins, set_cache_dir
+from ddupdate.credentials import read_credentials, write_credentials
+from ddupdate.credentials import CredentialsError
+from ddupdate.state import StateStore, SectionState, LockedError
 
 
 if 'XDG_CACHE_HOME' in os.environ:
@@ -27,6 +34,11 @@ if 'XDG_CACHE_HOME' in os.environ:
 else:
     CACHE_DIR = os.path.expanduser('~/.cache')
 
+if 'XDG_RUNTIME_DIR' in os.environ:
+    RUNTIME_DIR = os.environ['XDG_RUNTIME_DIR']
+else:
+    RUNTIME_DIR = os.path.join(CACHE_DIR, 'ddupdate')
+
 DEFAULTS = {
     'hostname': 'host.nowhere.net',
     'address-plugin': 'default-if',
@@ -37,6 +49,17 @@ DEFAULTS = {
     'service-options': None,
     'address-options': None,
     'ip-cache': os.path.join(CACHE_DIR, 'ddupdate'),
+    'address-cache-ttl': '0',
+    'ip-cache-ttl': None,
+    'ip-cache-jitter': '10',
+    'lock': 'wait',
+    'lock-timeout': '300',
+    'backoff': '5',
+    'backoff-max': '1440',
+    'check-interval': '300',
+    'check-interval-max': '3600',
+    'control-socket': os.path.join(RUNTIME_DIR, 'ddupdate.sock'),
+    'trigger-window': '10',
     'force': False
 }
 
@@ -54,58 +77,237 @@ class _SectionFailError(Exception):
     """General error, terminates section processing."""
 
 
+class _PendingUpdate:
+    """A section update deferred to a batch registration."""
+
+    # pylint: disable=too-few-public-methods,too-many-arguments
+
+    def __init__(self, section, opts, store, auth_plugin, service_plugin,
+                 ip, families):
+        """Store data for a section, see check_ip_cache() for families."""
+        self.section = section
+        self.opts = opts
+        self.store = store
+        self.auth_plugin = auth_plugin
+        self.service_plugin = service_plugin
+        self.ip = ip
+        self.families = families
+
+
 def envvar_default(var, default=None):
     """Return var if found in environment, else default."""
     return os.environ[var] if var in os.environ else default
 
 
-def ip_cache_setup(opts):
-    """Ensure that our cache directory exists, return cache file path."""
-    if not os.path.exists(opts.ip_cache):
-        os.makedirs(opts.ip_cache)
-    return os.path.join(opts.ip_cache, opts.service_plugin + '_' +
-                                       opts.hostname + '.ip')
+def get_store(stores, opts, log):
+    """Return the loaded StateStore for opts.ip_cache, cached in stores."""
+    if opts.ip_cache not in stores:
+        store = StateStore(opts.ip_cache)
+        try:
+            store.lock(0 if opts.lock == 'skip' else opts.lock_timeout)
+        except LockedError as err:
+            if opts.lock == 'skip':
+                log.info("Another ddupdate run is in progress, skipping")
+                raise _GoodbyeError() from err
+            raise _GoodbyeError(
+                "Timeout waiting for another ddupdate run", 1) from err
+        stores[opts.ip_cache] = store
+        log.debug("Loading state from: %s", store.path)
+        try:
+            store.load()
+        except sqlite3.Error as err:
+            raise _GoodbyeError(
+                "Cannot read state from %s: %s" % (store.path, err), 1) \
+                from err
+    return stores[opts.ip_cache]
 
 
-def ip_cache_clear(opts, log):
-    """Remove the cache file for actual service plugin in opts."""
-    path = ip_cache_setup(opts)
-    if not os.path.exists(path):
-        return
-    log.debug("Removing cache file: " + path)
-    os.unlink(path)
+def flush_stores(stores, log):
+    """Write all changed state to disk and release the locks."""
+    for store in stores.values():
+        try:
+            store.flush()
+        except sqlite3.Error as err:
+            log.error("Cannot save state to %s: %s", store.path, err)
+        finally:
+            store.unlock()
+
+
+def ip_cache_key(opts):
+    """Return the state key for actual service plugin and hostname."""
+    return opts.service_plugin + '_' + opts.hostname
 
 
-def ip_cache_data(opts, log, default=(IpAddr(ipv4="0.0.0.0"), 100000)):
+def ip_cache_clear(store, opts, log):
+    """Remove the cached state for actual service plugin in opts."""
+    log.debug("Clearing cached state for: " + ip_cache_key(opts))
+    store.clear_section(ip_cache_key(opts))
+
+
+def ip_cache_data(store, opts, default=(IpAddr(ipv4="0.0.0.0"), 100000)):
     """
     Return an (address, cache age in minute) tuple.
 
     If not existing, the default value is returned.
     """
-    path = ip_cache_setup(opts)
-    if not os.path.exists(path):
+    state = store.section(ip_cache_key(opts))
+    if not state or not state.ip or not state.updated:
         return default
-    mtime = os.stat(path)[stat.ST_MTIME]
+    delta = math.floor((time.time() - state.updated) / 60)
+    return state.ip, delta
+
+
+def ip_cache_set(store, opts, ip, families=('v4', 'v6')):
+    """
+    Set the cached address to IpAddr ip after a successful update.
+
+    Only the address families ('v4', 'v6') in families are updated,
+    others keep their cached address and age.
+    """
+    key = ip_cache_key(opts)
     now = time.time()
-    delta = math.floor((now - mtime) / 60)
-    with open(path) as f:
-        astr = f.read().strip()
-    try:
-        ll = ast.literal_eval(astr)
-        ip = IpAddr(ipv4=ll[0], ipv6=ll[1])
-    except SyntaxError:
-        log.debug("SyntaxError while reading ip cache.")
-        ip_cache_clear(opts, log)
-        ip, delta = default
-    return ip, delta
+    ip = ip if ip else IpAddr()
+    state = store.section(key)
+    old_ip = state.ip if state and state.ip else IpAddr()
+    family_updated = dict(state.family_updated) if state \
+        else {'v4': 0.0, 'v6': 0.0}
+    for family in families:
+        family_updated[family] = now
+    ip = IpAddr(ip.v4 if 'v4' in families else old_ip.v4,
+                ip.v6 if 'v6' in families else old_ip.v6)
+    changed = now if ip != old_ip or not state else state.changed
+    store.set_section(
+        key, SectionState(ip, now, now, 'ok', 0, family_updated, changed))
+
+
+def ip_cache_ttl(service_plugin, opts):
+    """
+    Return the ip cache timeout in minutes for actual section.
+
+    The ip-cache-ttl config value overrides the plugin default. The
+    result is reduced by up to ip-cache-jitter percent, using a fixed
+    fraction derived from the local host name and the section. This
+    spreads updates from identically configured hosts over time while
+    each host keeps a stable schedule.
+    """
+    ttl = opts.ip_cache_ttl
+    if ttl is None:
+        ttl = service_plugin.ip_cache_ttl()
+    seed = socket.gethostname() + ' ' + ip_cache_key(opts)
+    digest = hashlib.sha256(seed.encode('utf-8')).digest()
+    fraction = int.from_bytes(digest[:8], 'big') / 2 ** 64
+    jitter = min(max(opts.ip_cache_jitter, 0), 100) / 100
+    return ttl - math.floor(ttl * jitter * fraction)
+
+
+def stale_families(store, opts, ip, ttl):
+    """
+    Return list of address families which needs to be registered.
+
+    A family ('v4', 'v6') needs to be registered if the address differs
+    from the cached one, or if the cached one is older than ttl minutes.
+    """
+    state = store.section(ip_cache_key(opts))
+    if not state or not state.ip:
+        return ['v4', 'v6']
+    now = time.time()
+    stale = []
+    for family in ['v4', 'v6']:
+        address = getattr(ip, family)
+        age = math.floor((now - state.family_updated[family]) / 60)
+        if address != getattr(state.ip, family) or (address and age >= ttl):
+            stale.append(family)
+    return stale
+
+
+def ip_cache_fail(store, opts):
+    """Record a failed update attempt."""
+    key = ip_cache_key(opts)
+    state = store.section(key) or SectionState()
+    state.attempted = time.time()
+    state.outcome = 'error'
+    state.failures += 1
+    store.set_section(key, state)
+
+
+def backoff_delay(opts, failures):
+    """Return minutes to wait after given number of consecutive failures."""
+    if failures <= 0 or opts.backoff <= 0:
+        return 0
+    return min(opts.backoff * 2 ** min(failures - 1, 32), opts.backoff_max)
+
+
+def check_backoff(store, opts, log):
+    """
+    Throw _SectionFailError if the section is backing off after failures.
+
+    The --force option bypasses the backoff, a successful update then
+    resets it.
+    """
+    state = store.section(ip_cache_key(opts))
+    if not state or state.outcome != 'error':
+        return
+    if opts.force:
+        log.debug("Ignoring backoff after %d failure(s)", state.failures)
+        return
+    delay = backoff_delay(opts, state.failures)
+    age = math.floor((time.time() - state.attempted) / 60)
+    if age < delay:
+        log.info("Backing off after %d failure(s), next attempt in %d min",
+                 state.failures, delay - age)
+        raise _SectionFailError()
+
+
+def check_interval(store, opts):
+    """
+    Return seconds until next check of a section in daemon mode.
+
+    Right after an address change the section is checked every
+    check-interval seconds. The interval is then doubled each time the
+    time since the change doubles, up to check-interval-max.
+    """
+    low = max(opts.check_interval, 1)
+    high = max(opts.check_interval_max, low)
+    state = store.section(ip_cache_key(opts))
+    if not state or not state.changed:
+        return low
+    stable = time.time() - state.changed
+    interval = low
+    while interval < high and interval * 2 <= stable:
+        interval *= 2
+    return min(interval, high)
 
 
-def ip_cache_set(opts, ip):
-    """Set the cached address to IpAddr ip."""
-    path = ip_cache_setup(opts)
-    ip = ip if ip else IpAddr(ipv4="0.0.0.0")
-    with open(path, "w") as f:
-        f.write(str(ip))
+def address_cache_key(opts):
+    """Return the state key for actual address plugin and options."""
+    return ' '.join([opts.address_plugin] + opts.address_options)
+
+
+def address_cache_data(store, opts, log):
+    """
+    Return address from a fresh address cache, or None.
+
+    The cache is fresh if younger than opts.address_cache_ttl seconds.
+    """
+    if opts.force or opts.address_cache_ttl <= 0:
+        return None
+    ip, timestamp = store.address(address_cache_key(opts))
+    if not ip:
+        return None
+    age = time.time() - timestamp
+    if age >= opts.address_cache_ttl:
+        log.debug("Address cache is stale (%d/%d s)",
+                  age, opts.address_cache_ttl)
+        return None
+    log.debug("Address cache is fresh (%d/%d s)", age, opts.address_cache_ttl)
+    return ip
+
+
+def address_cache_set(store, opts, ip):
+    """Store address obtained from address plugin in the address cache."""
+    if opts.address_cache_ttl <= 0 or not ip or ip.empty():
+        return
+    store.set_address(address_cache_key(opts), ip)
 
 
 def here(path):
@@ -238,10 +440,31 @@ def get_parser(conf):
         "-p", "--set_password", nargs=3, metavar=('host', 'user', 'pw'),
         help='Update username/password for host. Use "" for empty username',
         default="")
+    others.add_argument(
+        "--import-passwords", metavar="path",
+        help='Store all credentials in CSV or JSON file, - for stdin',
+        dest='import_passwords', default=None)
+    others.add_argument(
+        "--export-passwords", metavar="path",
+        help='Write all credentials to CSV or *.json file, - for stdout',
+        dest='export_passwords', default=None)
     others.add_argument(
         "-f", "--force",
         help='Force run even if the cache is fresh',
         default=False, action='store_true')
+    others.add_argument(
+        "-D", "--daemon",
+        help='Keep running, check each section on its check-interval',
+        default=False, action='store_true')
+    others.add_argument(
+        "-t", "--trigger",
+        help='Run after a network event, merging events close in time',
+        default=False, action='store_true')
+    others.add_argument(
+        "-k", "--control", metavar="command", nargs='+',
+        help='Send command to running daemon: update, trigger, status'
+        + ' or flush, all optionally followed by sections',
+        default=None)
     others.add_argument(
         "-h", "--help", metavar="plugin",
         help='Print overall help or help for given plugin',
@@ -278,6 +501,22 @@ def parse_options(conf):
             opts.service_options = conf['service-options'].split()
     opts.loglevel = level_by_name[opts.loglevel]
     opts.ip_cache = conf['ip-cache']
+    try:
+        opts.address_cache_ttl = int(conf['address-cache-ttl'])
+        opts.ip_cache_ttl = \
+            int(conf['ip-cache-ttl']) if conf['ip-cache-ttl'] else None
+        opts.ip_cache_jitter = float(conf['ip-cache-jitter'])
+        opts.lock_timeout = float(conf['lock-timeout'])
+        opts.backoff = int(conf['backoff'])
+        opts.backoff_max = int(conf['backoff-max'])
+        opts.check_interval = int(conf['check-interval'])
+        opts.check_interval_max = int(conf['check-interval-max'])
+    except ValueError as err:
+        raise _GoodbyeError("Bad configuration value: " + str(err), 2) \
+            from None
+    if conf['lock'] not in ['wait', 'skip']:
+        raise _GoodbyeError("Bad lock value: " + conf['lock'], 2)
+    opts.lock = conf['lock']
     return opts
 
 
@@ -308,13 +547,26 @@ def log_init(log, loglevel, opts):
              (' '.join(opts.address_options) if opts.address_options else ''))
 
 
+# Loaded plugin modules: path -> (mtime, module).
+_modules = {}
+
+
 def load_module(path):
-    """Return instantiated module loaded from given path."""
+    """
+    Return instantiated module loaded from given path.
+
+    Modules are loaded once per process and reused while unchanged, so
+    module level state like caches survives between sections.
+    """
     # pylint: disable=deprecated-method
+    mtime = os.stat(path).st_mtime_ns
+    if path in _modules and _modules[path][0] == mtime:
+        return _modules[path][1]
     name = os.path.basename(path).replace('.py', '')
     spec = importlib.util.spec_from_file_location(name, path)
     module = importlib.util.module_from_spec(spec)
     spec.loader.exec_module(module)
+    _modules[path] = (mtime, module)
     return module
 
 
@@ -386,12 +638,41 @@ def set_password(opts):
     auth_plugin.set_password(*opts.set_password)
 
 
+def transfer_passwords(opts, machines):
+    """
+    Handle --import-passwords and --export-passwords options.
+
+    machines is the list of credential machine names used by the
+    configured sections, see section_auth_machines().
+    """
+    auth_plugin = get_auth_plugin()
+    try:
+        if opts.import_passwords == '-':
+            auth_plugin.set_passwords(read_credentials(sys.stdin))
+        elif opts.import_passwords:
+            with open(opts.import_passwords) as f:
+                auth_plugin.set_passwords(read_credentials(f))
+        if opts.export_passwords:
+            credentials = auth_plugin.get_passwords(machines)
+            path = opts.export_passwords
+            fmt = 'json' if path.endswith('.json') else 'csv'
+            if path == '-':
+                write_credentials(sys.stdout, credentials, fmt)
+                return
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                # An existing file keeps its mode, restrict before writing.
+                os.fchmod(fd, 0o600)
+                os.ftruncate(fd, 0)
+                write_credentials(f, credentials, fmt)
+    except (OSError, CredentialsError, AuthError) as err:
+        raise _GoodbyeError("Cannot transfer credentials: " + str(err), 1) \
+            from None
+
+
 def filter_ip(ip_version, ip):
     """Filter the ip address to match the --ip-version option."""
-    if ip_version == 'v4':
-        ip.v6 = None
-    elif ip_version == 'v6':
-        ip.v4 = None
+    ip = ip.filtered(ip_version)
     if ip.empty():
         raise AddressError("No usable address")
     return ip
@@ -412,13 +693,15 @@ def build_load_path(log):
     return paths
 
 
-def get_plugins(opts, log, sections):
+def find_plugins(log):
     """
-    Handles plugin listing, plugin help or load plugins.
+    Load all plugins in the load path.
 
-    Return: (auth_plugin, ip plugin, service plugin) tuple.
+    Plugins found first in the load path take precedence.
+
+    Return: (auth plugins, ip plugins, service plugins) tuple of dicts
+    name -> plugin.
     """
-    # pylint: disable=too-many-branches,too-many-locals
     ip_plugins = {}
     service_plugins = {}
     auth_plugins = {}
@@ -430,6 +713,20 @@ def get_plugins(opts, log, sections):
             service_plugins.setdefault(name, plugin)
         for name, plugin in auths.items():
             auth_plugins.setdefault(name, plugin)
+    set_address_plugins(ip_plugins)
+    return auth_plugins, ip_plugins, service_plugins
+
+
+def get_plugins(opts, log, sections, plugins):
+    """
+    Handles plugin listing, plugin help or selects plugins.
+
+    plugins is the tuple returned by find_plugins().
+
+    Return: (auth_plugin, ip plugin, service plugin) tuple.
+    """
+    # pylint: disable=too-many-branches
+    auth_plugins, ip_plugins, service_plugins = plugins
     if opts.list_services:
         list_plugins(service_plugins)
         raise _GoodbyeError()
@@ -466,13 +763,18 @@ def get_plugins(opts, log, sections):
     return auth_plugin, ip_plugin, service_plugin
 
 
-def get_ip(ip_plugin, opts, log):
+def get_ip(ip_plugin, opts, log, store):
     """Try to get current ip address using the ip_plugin."""
-    try:
-        ip = ip_plugin.get_ip(log, opts.address_options)
-    except AddressError as err:
-        raise _SectionFailError("Cannot obtain ip address: " + str(err)) \
-            from err
+    ip = address_cache_data(store, opts, log)
+    if ip:
+        log.info("Using cached address from %s", opts.address_plugin)
+    else:
+        try:
+            ip = ip_plugin.get_ip(log, opts.address_options)
+        except AddressError as err:
+            raise _SectionFailError("Cannot obtain ip address: " + str(err)) \
+                from err
+        address_cache_set(store, opts, ip)
     if not ip or ip.empty():
         log.info("Using ip address provided by update service")
         ip = None
@@ -482,41 +784,157 @@ def get_ip(ip_plugin, opts, log):
     return ip
 
 
-def check_ip_cache(ip, service_plugin, opts, log):
-    """Throw a _SectionFailError if ip is already in a fresh cache."""
+def check_ip_cache(ip, service_plugin, opts, log, store):
+    """
+    Return a (ip, families) tuple describing what to register.
+
+    families is the address families ('v4', 'v6') to be updated. If
+    the service plugin supports partial updates and only one family
+    has changed, ip only contains this family.
+
+    Throws a _SectionFailError if ip is already in a fresh cache. The
+    --force option registers all families, leaving the cached state as
+    is until the update succeeds.
+    """
     if opts.force:
-        ip_cache_clear(opts, log)
-    cached_ip, age = ip_cache_data(opts, log)
-    if age < service_plugin.ip_cache_ttl() and (cached_ip == ip or not ip):
-        log.info("Update inhibited, cache is fresh (%d/%d min)",
-                 age, service_plugin.ip_cache_ttl())
+        log.debug("Forced update, ignoring cached state")
+        return ip, ['v4', 'v6']
+    ttl = ip_cache_ttl(service_plugin, opts)
+    cached_ip, age = ip_cache_data(store, opts)
+    if not ip:
+        stale = ['v4', 'v6'] if age >= ttl else []
+    else:
+        stale = stale_families(store, opts, ip, ttl)
+    if not stale:
+        log.info("Update inhibited, cache is fresh (%d/%d min)", age, ttl)
         raise _SectionFailError()
+    if ip and service_plugin.partial_update() and len(stale) == 1:
+        partial_ip = ip.filtered(stale[0])
+        if partial_ip != ip and not partial_ip.empty():
+            log.info("Only the %s address needs update (cached: %s)",
+                     stale[0], cached_ip)
+            return partial_ip, stale
+    return ip, ['v4', 'v6']
 
 
-def main():
-    """Indeed: main function."""
+def section_auth_machines(config, sections, log, plugins):
+    """
+    Return credentials used by sections, plugins as from find_plugins().
+
+    Return: dict auth plugin name -> (auth plugin, list of machines),
+    see ServicePlugin.auth_machines().
+    """
+    result = {}
+    for section in sections:
+        try:
+            opts = parse_options(parse_config(config, section))
+            auth_plugin, _, service_plugin = \
+                get_plugins(opts, log, sections, plugins)
+        except _GoodbyeError:
+            continue    # Reported when processing the section.
+        machines = result.setdefault(
+            auth_plugin.name(), (auth_plugin, []))[1]
+        for machine in service_plugin.auth_machines(
+                opts.hostname, opts.service_options):
+            if machine not in machines:
+                machines.append(machine)
+    return result
+
+
+def prefetch_auth(config, sections, log, plugins, ttl=None):
+    """
+    Invoke prefetch() once for each auth plugin used in sections.
+
+    ttl is the number of seconds until next run in daemon mode, or None.
+    """
+    for auth_plugin, machines in \
+            section_auth_machines(config, sections, log, plugins).values():
+        try:
+            auth_plugin.prefetch(log, machines, ttl)
+        except AuthError as err:
+            log.debug("Cannot prefetch credentials: %s", err)
+
+
+def register_batches(pending, log):
+    """
+    Register all _PendingUpdate in pending.
+
+    Updates using the same service plugin, auth plugin and cache
+    directory are registered using a single register_batch() call.
+    """
+    batches = {}
+    for update in pending:
+        key = (update.service_plugin.name(), update.auth_plugin.name(),
+               update.opts.ip_cache)
+        batches.setdefault(key, []).append(update)
+    for updates in batches.values():
+        service_plugin = updates[0].service_plugin
+        set_auth_plugin(updates[0].auth_plugin)
+        set_cache_dir(updates[0].opts.ip_cache)
+        log.info("Registering %d host(s) using %s",
+                 len(updates), service_plugin.name())
+        args = [(u.opts.hostname, u.ip, u.opts.service_options)
+                for u in updates]
+        try:
+            results = service_plugin.register_batch(log, args)
+        except (ServiceError, AuthError) as err:
+            results = [err] * len(updates)
+        for update, err in zip(updates, results):
+            if err:
+                ip_cache_fail(update.store, update.opts)
+                log.error("Cannot update DNS data for %s: %s",
+                          update.opts.hostname, err)
+                log.info("Skipping config section: %s", update.section)
+            else:
+                ip_cache_set(update.store, update.opts, update.ip,
+                             update.families)
+                log.info("Update OK: %s", update.opts.hostname)
+
+
+def run_sections(config, sections, log, plugins, force=True, ttl=None,
+                 crashed=None):
+    """
+    Check and possibly update given sections once.
+
+    plugins is the tuple returned by find_plugins(). If force is False,
+    the --force option is ignored. ttl is passed to prefetch_auth(). If
+    crashed is a list, unexpected errors in a section are logged and the
+    section appended to it instead of propagated.
+    """
+    # pylint: disable=too-many-locals,too-many-branches,too-many-arguments
+    prefetch_auth(config, sections, log, plugins, ttl)
+    stores = {}
+    pending = []
     try:
-        log = log_setup()
-        config, sections = get_config(log)
-        opts = parse_options(DEFAULTS)
-        get_plugins(opts, log, sections)
-        if opts.execute_section:
-            sections = [opts.execute_section]
         for section in sections:
             try:
                 conf = parse_config(config, section)
                 opts = parse_options(conf)
+                opts.force = opts.force and force
                 log_init(log, None, opts)
                 log.info("Processing configuration section: %s", section)
                 auth_plugin, ip_plugin, service_plugin = get_plugins(
-                    opts, log, sections)
+                    opts, log, sections, plugins)
                 set_auth_plugin(auth_plugin)
                 log.debug("Using auth plugin: %s", str(auth_plugin))
-                ip = get_ip(ip_plugin, opts, log)
-                check_ip_cache(ip, service_plugin, opts, log)
-                service_plugin.register(
-                    log, opts.hostname, ip, opts.service_options)
-                ip_cache_set(opts, ip)
+                store = get_store(stores, opts, log)
+                set_cache_dir(opts.ip_cache)
+                check_backoff(store, opts, log)
+                ip = get_ip(ip_plugin, opts, log, store)
+                ip, families = check_ip_cache(
+                    ip, service_plugin, opts, log, store)
+                if service_plugin.batch_update():
+                    pending.append(_PendingUpdate(
+                        section, opts, store, auth_plugin,
+                        service_plugin, ip, families))
+                    continue
+                try:
+                    service_plugin.register(
+                        log, opts.hostname, ip, opts.service_options)
+                except (ServiceError, AuthError):
+                    ip_cache_fail(store, opts)
+                    raise
+                ip_cache_set(store, opts, ip, families)
                 log.info("Update OK")
             except _SectionFailError:
                 print("Skipping config section: %s" % section)
@@ -525,6 +943,361 @@ def main():
                 log.error("Cannot update DNS data: %s", err)
                 log.info("Skipping config section: %s", section)
                 continue
+            except AddressError as err:
+                log.error("Cannot use ip address: %s", err)
+                log.info("Skipping config section: %s", section)
+                continue
+            except _GoodbyeError:
+                raise
+            except Exception:      # pylint: disable=broad-except
+                if crashed is None:
+                    raise
+                log.exception("Unexpected error in section %s", section)
+                crashed.append(section)
+                continue
+        register_batches(pending, log)
+    finally:
+        flush_stores(stores, log)
+
+
+def control_socket_path(config):
+    """Return control socket path from the config file DEFAULT section."""
+    return parse_config(config, 'DEFAULT')['control-socket']
+
+
+def send_control(config, words):
+    """Send command words to the daemon and print the reply."""
+    path = control_socket_path(config)
+    try:
+        reply = daemon.send_command(path, words)
+    except OSError as err:
+        raise _GoodbyeError(
+            "Cannot contact ddupdate daemon at %s: %s" % (path, err), 3) \
+            from None
+    status, _, text = reply.partition('\n')
+    sys.stdout.write(text)
+    if status != 'OK':
+        raise _GoodbyeError(status.replace('ERROR ', '', 1), 1)
+    raise _GoodbyeError()
+
+
+def control_sections(scheduler, args):
+    """Return sections named in args, all if empty."""
+    unknown = [s for s in args if s not in scheduler.intervals]
+    if unknown:
+        raise daemon.ControlError("No such section: " + ' '.join(unknown))
+    return args if args else list(scheduler.intervals)
+
+
+def control_update(scheduler, args):
+    """Control command: check given sections now."""
+    sections = control_sections(scheduler, args)
+    scheduler.trigger(sections)
+    return "Queued %d section(s)\n" % len(sections)
+
+
+def control_status(config, scheduler, args):
+    """Control command: report state, without running any plugin."""
+    stores = {}
+    lines = []
+    for section in control_sections(scheduler, args):
+        opts = parse_options(parse_config(config, section))
+        if opts.ip_cache not in stores:
+            stores[opts.ip_cache] = StateStore(opts.ip_cache)
+            try:
+                stores[opts.ip_cache].load()
+            except sqlite3.Error as err:
+                raise daemon.ControlError(
+                    "Cannot read state: " + str(err)) from None
+        state = stores[opts.ip_cache].section(ip_cache_key(opts))
+        state = state if state else SectionState()
+        updated = "%d min ago" % ((time.time() - state.updated) // 60) \
+            if state.updated else "never"
+        outcome = state.outcome if state.outcome else "none"
+        if state.failures:
+            outcome += " (%d failures)" % state.failures
+        ip = state.ip if state.ip else IpAddr()
+        addresses = ' '.join([a for a in [ip.v4, ip.v6] if a]) or '-'
+        next_check = scheduler.due[section] - time.monotonic()
+        lines.append(
+            "%s: %s %s, outcome: %s, updated: %s, next check in %d s"
+            % (section, opts.hostname, addresses, outcome, updated,
+               max(next_check, 0)))
+    return ''.join(line + '\n' for line in lines)
+
+
+def clear_cache(config, sections, log, addresses_only=False, timeout=None):
+    """
+    Drop cached addresses and, unless addresses_only, registered state.
+
+    timeout is the max seconds to wait for the state locks, by default
+    the lock-timeout option. All locks are taken before anything is
+    changed, so nothing is cleared if any of them is busy.
+
+    Raises:
+      - LockedError or sqlite3.Error if the state cannot be updated.
+
+    """
+    by_cache = {}
+    for section in sections:
+        opts = parse_options(parse_config(config, section))
+        if addresses_only and opts.address_cache_ttl <= 0:
+            continue
+        by_cache.setdefault(opts.ip_cache, []).append(opts)
+    stores = {}
+    try:
+        for ip_cache, section_opts in by_cache.items():
+            wait = section_opts[0].lock_timeout if timeout is None else timeout
+            stores[ip_cache] = StateStore(ip_cache)
+            stores[ip_cache].lock(wait)
+        for ip_cache, store in stores.items():
+            store.load()
+            for opts in by_cache[ip_cache]:
+                if not addresses_only:
+                    ip_cache_clear(store, opts, log)
+                store.clear_address(address_cache_key(opts))
+            store.flush()
+    finally:
+        for store in stores.values():
+            store.unlock()
+
+
+def control_flush(config, scheduler, args, log):
+    """
+    Control command: drop cached state, next check updates.
+
+    The daemon cannot wait for the state lock, if locked the client
+    should retry.
+    """
+    sections = control_sections(scheduler, args)
+    try:
+        clear_cache(config, sections, log, timeout=0)
+    except LockedError:
+        raise daemon.ControlError("state locked, retry") from None
+    except sqlite3.Error as err:
+        raise daemon.ControlError("Cannot flush: " + str(err)) from None
+    return "Flushed %d section(s)\n" % len(sections)
+
+
+def control_trigger(config, scheduler, args, log):
+    """
+    Control command: check sections after a network event.
+
+    The check is done after trigger-window seconds, so events in this
+    period are merged into one check. Triggers received during a run
+    are dropped.
+    """
+    sections = control_sections(scheduler, args)
+    if scheduler.busy:
+        return "Dropped, received during a run\n"
+    try:
+        clear_cache(config, sections, log, addresses_only=True, timeout=0)
+    except LockedError:
+        raise daemon.ControlError("state locked, retry") from None
+    except sqlite3.Error as err:
+        raise daemon.ControlError("Cannot trigger: " + str(err)) from None
+    scheduler.trigger(sections, trigger_window(config))
+    return "Queued %d section(s)\n" % len(sections)
+
+
+def trigger_window(config):
+    """Return the trigger-window value from the DEFAULT section."""
+    try:
+        return float(parse_config(config, 'DEFAULT')['trigger-window'])
+    except ValueError as err:
+        raise _GoodbyeError("Bad configuration value: " + str(err), 2) \
+            from None
+
+
+def run_trigger(config, sections, opts, log):
+    """
+    Handle --trigger, invoked after a network event.
+
+    If a daemon is running, it is sent a trigger command. Otherwise a
+    lock in the cache directory is held while waiting trigger-window
+    seconds and then running sections. Triggers finding the lock held,
+    i. e., during the wait or the run, are merged into this run.
+    """
+    window = trigger_window(config)
+    defaults = parse_config(config, 'DEFAULT')
+    words = ['trigger'] + ([opts.execute_section]
+                           if opts.execute_section else [])
+    try:
+        reply = daemon.send_command(defaults['control-socket'], words)
+    except (FileNotFoundError, ConnectionRefusedError):
+        reply = None
+    except OSError as err:
+        log.info("Daemon is busy, trigger dropped: %s", err)
+        return
+    if reply is not None:
+        status, _, text = reply.partition('\n')
+        if status != 'OK':
+            raise _GoodbyeError(status.replace('ERROR ', '', 1), 1)
+        log.info("Daemon: %s", text.strip())
+        return
+    os.makedirs(defaults['ip-cache'], exist_ok=True)
+    path = os.path.join(defaults['ip-cache'], 'trigger.lock')
+    with open(path, 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            log.info("Merged into pending or running trigger")
+            return
+        log.info("Waiting %d seconds for more events", window)
+        time.sleep(max(window, 0))
+        try:
+            clear_cache(config, sections, log, addresses_only=True)
+        except (LockedError, sqlite3.Error) as err:
+            raise _GoodbyeError("Cannot clear address cache: " + str(err), 1) \
+                from None
+        run_sections(config, sections, log, find_plugins(log))
+
+
+def next_intervals(config, sections, log):
+    """Return dict section -> seconds to next check, see check_interval()."""
+    stores = {}
+    intervals = {}
+    for section in sections:
+        opts = parse_options(parse_config(config, section))
+        if opts.ip_cache not in stores:
+            stores[opts.ip_cache] = StateStore(opts.ip_cache)
+            try:
+                stores[opts.ip_cache].load()
+            except sqlite3.Error as err:
+                log.warning("Cannot read state: %s", err)
+        intervals[section] = check_interval(stores[opts.ip_cache], opts)
+        log.debug("Next check of %s in %d seconds",
+                  section, intervals[section])
+    return intervals
+
+
+def crash_intervals(config, sections, crashes):
+    """
+    Return dict section -> seconds to next check after unexpected errors.
+
+    crashes is a dict section -> number of consecutive unexpected errors.
+    The delay grows like the backoff after failed updates, but is never
+    shorter than check-interval.
+    """
+    intervals = {}
+    for section in sections:
+        opts = parse_options(parse_config(config, section))
+        intervals[section] = max(
+            backoff_delay(opts, crashes.get(section, 1)) * 60,
+            opts.check_interval, 1)
+    return intervals
+
+
+def run_daemon(config, opts, log):
+    """
+    Check all sections on their check-interval until terminated.
+
+    The configuration file and the plugins are re-read on SIGHUP. Errors
+    in a run are logged, the daemon continues with the next run. Sections
+    failing with unexpected errors are checked again after a backoff
+    delay. Commands are read from the control socket, see send_control().
+    """
+    current = {'crashes': {}}
+
+    def load():
+        try:
+            config, sections = get_config(log)
+            if opts.execute_section:
+                sections = [opts.execute_section]
+            trigger_window(config)
+            plugins = find_plugins(log)
+            intervals = {}
+            longest = 0
+            for section in sections:
+                section_opts = parse_options(parse_config(config, section))
+                intervals[section] = max(section_opts.check_interval, 1)
+                longest = max(longest, intervals[section],
+                              section_opts.check_interval_max)
+        except _GoodbyeError as err:
+            if 'config' not in current:
+                raise
+            log.error("Cannot reload configuration: %s", err.msg)
+            return None
+        current['config'] = config
+        current['plugins'] = plugins
+        current['ttl'] = longest
+        return intervals
+
+    def run(sections, first):
+        crashed = []
+        try:
+            run_sections(current['config'], sections, log,
+                         current['plugins'], first, current['ttl'], crashed)
+            intervals = next_intervals(current['config'], sections, log)
+        except _GoodbyeError as err:
+            if err.exitcode != 0:
+                log.error(err.msg)
+            return None
+        except Exception:      # pylint: disable=broad-except
+            log.exception("Unexpected error checking: %s", ' '.join(sections))
+            crashed = sections
+            intervals = {}
+        crashes = current['crashes']
+        for section in sections:
+            if section in crashed:
+                crashes[section] = crashes.get(section, 0) + 1
+            else:
+                crashes.pop(section, None)
+        intervals.update(crash_intervals(current['config'], crashed, crashes))
+        return intervals
+
+    commands = {
+        'update': control_update,
+        'status': lambda scheduler, args:
+            control_status(current['config'], scheduler, args),
+        'flush': lambda scheduler, args:
+            control_flush(current['config'], scheduler, args, log),
+        'trigger': lambda scheduler, args:
+            control_trigger(current['config'], scheduler, args, log),
+    }
+    path = control_socket_path(config)
+    try:
+        sock, lock_file = daemon.open_control_socket(path)
+    except OSError as err:
+        raise _GoodbyeError(
+            "Cannot open control socket %s: %s" % (path, err), 1) from None
+    try:
+        daemon.serve(log, load, run, (sock, commands))
+    finally:
+        sock.close()
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+        lock_file.close()
+
+
+def main():
+    """Indeed: main function."""
+    try:
+        log = log_setup()
+        config, sections = get_config(log)
+        opts = parse_options(DEFAULTS)
+        if opts.control:
+            send_control(config, opts.control)
+        if opts.execute_section:
+            sections = [opts.execute_section]
+        if opts.trigger:
+            run_trigger(config, sections, opts, log)
+            return
+        plugins = find_plugins(log)
+        auth_plugin = get_plugins(opts, log, sections, plugins)[0]
+        if opts.import_passwords or opts.export_passwords:
+            set_auth_plugin(auth_plugin)
+            machines = section_auth_machines(
+                config, sections, log, plugins).get(
+                    auth_plugin.name(), (None, []))[1]
+            transfer_passwords(opts, machines)
+            return
+        if opts.daemon:
+            run_daemon(config, opts, log)
+            return
+        run_sections(config, sections, log, plugins)
     except _GoodbyeError as err:
         if err.exitcode != 0:
             log.error(err.msg)
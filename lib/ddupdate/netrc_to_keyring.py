@@ -1,19 +1,28 @@
 """Simple tools to  migrate  credentials  from  ~/.netrc to the keyring.
 """
 
-import netrc
+import logging
+import sys
 
-import keyring
+from ddupdate.ddplugin import AuthError
+from ddupdate.main import build_load_path, load_plugins
 
 
 def main():
     """Indeed: main function."""
-    _netrc = netrc.netrc()
-    for host in _netrc.hosts:
-        login, _, password = _netrc.authenticators(host)
-        print(host)
-        credentials = "{0}\t{1}".format((login or 'api_key'), password)
-        keyring.set_password('ddupdate', host, credentials)
+    log = logging.getLogger('ddupdate')
+    auth_plugins = {}
+    for path in build_load_path(log):
+        for name, plugin in load_plugins(path, log)[0].items():
+            auth_plugins.setdefault(name, plugin)
+    try:
+        credentials = auth_plugins['netrc'].get_passwords()
+        for machine, _, _ in credentials:
+            print(machine)
+        auth_plugins['keyring'].set_passwords(credentials)
+    except AuthError as err:
+        print("Cannot migrate credentials: " + str(err), file=sys.stderr)
+        sys.exit(1)
 
 
 if __name__ == '__main__':
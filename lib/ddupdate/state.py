@@ -0,0 +1,268 @@
+"""
+Persistent state shared between ddupdate runs.
+
+All state lives in a single SQLite database in the cache directory:
+the last registered address and update outcome for each service
+plugin/hostname pair, and addresses cached from address plugins.
+
+The database is read once when loaded. Changes are kept in memory
+and written in a single transaction by flush(), SQLite makes this
+write atomic. To avoid concurrent runs using stale data, callers should
+hold the store's lock() from before load() until after flush().
+"""
+
+import ast
+import fcntl
+import glob
+import os
+import os.path
+import sqlite3
+import time
+
+from ddupdate.ddplugin import IpAddr, AddressError
+
+DB_NAME = 'ddupdate.db'
+LOCK_NAME = 'ddupdate.lock'
+
+# Bump when the schema changes. Since this is a cache, an old database
+# is simply dropped and recreated.
+_SCHEMA_VERSION = 3
+
+_SCHEMA = [
+    """CREATE TABLE sections (
+        key TEXT PRIMARY KEY,
+        v4 TEXT,
+        v6 TEXT,
+        v4_updated REAL,
+        v6_updated REAL,
+        updated REAL,
+        attempted REAL,
+        outcome TEXT,
+        failures INTEGER,
+        changed REAL)""",
+    """CREATE TABLE addresses (
+        key TEXT PRIMARY KEY,
+        v4 TEXT,
+        v6 TEXT,
+        updated REAL)""",
+]
+
+
+class LockedError(Exception):
+    """The store is locked by another process."""
+
+
+class SectionState:
+    """Cached data for one service plugin + hostname combination."""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, ip=None, updated=0.0, attempted=0.0,
+                 outcome=None, failures=0, family_updated=None, changed=0.0):
+        """
+        Construct a fresh object.
+
+        Parameters:
+          - ip: IpAddr, last address registered, None if unknown.
+          - updated: float, time of last successful update.
+          - attempted: float, time of last update attempt.
+          - outcome: string, 'ok' or 'error' for last attempt, None
+            if unknown.
+          - failures: int, number of consecutive failed attempts.
+          - family_updated: dict, time of last successful update for
+            each of 'v4' and 'v6'. Defaults to updated for both.
+          - changed: float, time when a changed address was last
+            registered, 0 if unknown.
+
+        """
+        # pylint: disable=too-many-arguments
+        self.ip = ip
+        self.updated = updated
+        self.family_updated = family_updated if family_updated \
+            else {'v4': updated, 'v6': updated}
+        self.attempted = attempted
+        self.outcome = outcome
+        self.failures = failures
+        self.changed = changed
+
+
+def _to_ip(v4, v6):
+    """Return IpAddr for stored strings, None if invalid."""
+    try:
+        return IpAddr(v4, v6)
+    except AddressError:
+        return None
+
+
+class StateStore:
+    """The state database for a given cache directory."""
+
+    def __init__(self, directory):
+        """Create a store in directory, use load() to read it."""
+        self.directory = directory
+        self.path = os.path.join(directory, DB_NAME)
+        self._sections = {}
+        self._addresses = {}
+        self._dirty_sections = set()
+        self._dirty_addresses = set()
+        self._lock_file = None
+
+    def lock(self, timeout=None):
+        """
+        Take an exclusive, advisory lock on the store.
+
+        Parameters:
+          - timeout: float, max seconds to wait for the lock. 0 means
+            don't wait, None waits forever.
+        Raises:
+          - LockedError if the lock cannot be taken in time.
+
+        """
+        if self._lock_file:
+            return
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        # pylint: disable=consider-using-with
+        lock_file = open(os.path.join(self.directory, LOCK_NAME), 'a')
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if timeout is not None and time.monotonic() >= deadline:
+                    lock_file.close()
+                    raise LockedError(
+                        "State is locked: " + self.directory) from None
+                time.sleep(0.1)
+        self._lock_file = lock_file
+
+    def unlock(self):
+        """Release lock taken by lock(), if any."""
+        if self._lock_file:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _connect(self):
+        """Return a connection, creating the schema if required."""
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        conn = sqlite3.connect(self.path, timeout=30)
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        if version != _SCHEMA_VERSION:
+            with conn:
+                for table in ['sections', 'addresses']:
+                    conn.execute('DROP TABLE IF EXISTS ' + table)
+                for statement in _SCHEMA:
+                    conn.execute(statement)
+                conn.execute('PRAGMA user_version = %d' % _SCHEMA_VERSION)
+            if version == 0:
+                self._import_legacy()
+        return conn
+
+    def _import_legacy(self):
+        """Import *.ip files used before the database existed."""
+        for path in glob.glob(os.path.join(self.directory, '*.ip')):
+            key = os.path.basename(path)[:-len('.ip')]
+            try:
+                with open(path) as f:
+                    ll = ast.literal_eval(f.read().strip())
+                ip = IpAddr(ll[0], ll[1])
+                mtime = os.stat(path).st_mtime
+            except (OSError, SyntaxError, ValueError, IndexError,
+                    AddressError):
+                continue
+            self._sections[key] = SectionState(ip, mtime, mtime, 'ok')
+            self._dirty_sections.add(key)
+
+    def load(self):
+        """Read all state from the database."""
+        conn = self._connect()
+        try:
+            for row in conn.execute('SELECT * FROM sections'):
+                key, v4, v6, v4_updated, v6_updated = row[0:5]
+                updated, attempted, outcome, failures, changed = row[5:10]
+                if key in self._sections:
+                    continue
+                self._sections[key] = SectionState(
+                    _to_ip(v4, v6), updated or 0.0, attempted or 0.0,
+                    outcome, failures or 0,
+                    {'v4': v4_updated or 0.0, 'v6': v6_updated or 0.0},
+                    changed or 0.0)
+            for key, v4, v6, updated in \
+                    conn.execute('SELECT * FROM addresses'):
+                self._addresses[key] = (_to_ip(v4, v6), updated or 0.0)
+        finally:
+            conn.close()
+
+    def flush(self):
+        """Write all changes to the database in one transaction."""
+        if not self._dirty_sections and not self._dirty_addresses:
+            return
+        conn = self._connect()
+        try:
+            with conn:
+                for key in self._dirty_sections:
+                    state = self._sections.get(key)
+                    if not state:
+                        conn.execute(
+                            'DELETE FROM sections WHERE key = ?', (key,))
+                        continue
+                    ip = state.ip if state.ip else IpAddr()
+                    conn.execute(
+                        'INSERT OR REPLACE INTO sections'
+                        ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        (key, ip.v4, ip.v6, state.family_updated['v4'],
+                         state.family_updated['v6'], state.updated,
+                         state.attempted, state.outcome, state.failures,
+                         state.changed))
+                for key in self._dirty_addresses:
+                    if key not in self._addresses:
+                        conn.execute(
+                            'DELETE FROM addresses WHERE key = ?', (key,))
+                        continue
+                    ip, updated = self._addresses[key]
+                    conn.execute(
+                        'INSERT OR REPLACE INTO addresses'
+                        ' VALUES (?, ?, ?, ?)',
+                        (key, ip.v4, ip.v6, updated))
+        finally:
+            conn.close()
+        self._dirty_sections.clear()
+        self._dirty_addresses.clear()
+
+    def section(self, key):
+        """Return SectionState for key, or None."""
+        return self._sections.get(key)
+
+    def set_section(self, key, state):
+        """Store SectionState for key."""
+        self._sections[key] = state
+        self._dirty_sections.add(key)
+
+    def clear_section(self, key):
+        """Remove state for key."""
+        if key in self._sections:
+            del self._sections[key]
+            self._dirty_sections.add(key)
+
+    def sections(self):
+        """Return dict of all SectionState keyed by key."""
+        return dict(self._sections)
+
+    def address(self, key):
+        """Return a cached (IpAddr, timestamp) tuple or (None, 0)."""
+        return self._addresses.get(key, (None, 0.0))
+
+    def set_address(self, key, ip, timestamp=None):
+        """Cache an address from an address plugin."""
+        self._addresses[key] = (ip, timestamp if timestamp else time.time())
+        self._dirty_addresses.add(key)
+
+    def clear_address(self, key):
+        """Remove cached address for key."""
+        if key in self._addresses:
+            del self._addresses[key]
+            self._dirty_addresses.add(key)
@@ -0,0 +1,64 @@
+"""
+ddupdate plugin combining ipv4 and ipv6 addresses from other plugins.
+
+See: ddupdate(8)
+"""
+
+import concurrent.futures
+
+from ddupdate.ddplugin import AddressPlugin, AddressError, IpAddr
+from ddupdate.ddplugin import dict_of_opts, get_address_plugin
+
+
+class CompositePlugin(AddressPlugin):
+    """
+    Get ipv4 and ipv6 addresses from two other address plugins.
+
+    The plugins are invoked concurrently, the ipv4 address is picked
+    from the v4 plugin and the ipv6 address from the v6 one. If one
+    of them fails the other address is still used. Example:
+
+        v4=default-web-ip v6=hardcoded-if v6-options=if=eth0
+
+    Options:
+        v4=plugin               Plugin providing the ipv4 address.
+        v6=plugin               Plugin providing the ipv6 address.
+        v4-options=opt,...      Comma-separated options for v4 plugin.
+        v6-options=opt,...      Comma-separated options for v6 plugin.
+    """
+
+    _name = 'composite'
+    _oneliner = 'Combine ipv4 and ipv6 addresses from two plugins'
+
+    def get_ip(self, log, options):
+        """Implement AddressPlugin.get_ip()."""
+        opts = dict_of_opts(options)
+        if 'v4' not in opts and 'v6' not in opts:
+            raise AddressError('Required option v4= or v6= missing.')
+        jobs = {}
+        for family in ['v4', 'v6']:
+            if family not in opts:
+                continue
+            plugin = get_address_plugin(opts[family])
+            if not plugin or plugin.name() == self.name():
+                raise AddressError('Bad address plugin: ' + opts[family])
+            sub_options = opts.get(family + '-options', '')
+            jobs[family] = (plugin, [o for o in sub_options.split(',') if o])
+
+        def get_family_ip(family):
+            """Run plugin for family, return address or None."""
+            plugin, sub_options = jobs[family]
+            log.debug("Running %s for %s", plugin.name(), family)
+            try:
+                ip = plugin.get_ip(log, sub_options)
+            except AddressError as err:
+                log.warning("%s failed: %s", plugin.name(), err)
+                return None
+            return getattr(ip, family) if ip else None
+
+        with concurrent.futures.ThreadPoolExecutor(len(jobs)) as executor:
+            found = dict(zip(jobs, executor.map(get_family_ip, jobs)))
+        if not any(found.values()):
+            raise AddressError("No address found by %s"
+                               % ', '.join(opts[f] for f in jobs))
+        return IpAddr(found.get('v4'), found.get('v6'))
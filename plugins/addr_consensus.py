@@ -0,0 +1,137 @@
+"""
+ddupdate plugin retrieving an address agreed upon by several web services.
+
+See: ddupdate(8)
+"""
+
+import concurrent.futures
+import ipaddress
+import re
+import urllib.error
+import urllib.request
+
+from ddupdate.ddplugin import AddressPlugin, AddressError, IpAddr
+from ddupdate.ddplugin import dict_of_opts
+
+TIMEOUT = 20
+
+# Sources used by default-web-ip, default-web-ip6 and ip.dnshome.de.
+_URLS = [
+    'http://checkip.dyndns.org/',
+    'https://api.ipify.org?format=json',
+    'https://ifconfig.co',
+    'https://ip4.dnshome.de',
+]
+
+_URLS6 = [
+    'https://now-dns.com/ip',
+    'http://ipv6.whatismyip.akamai.com',
+    'https://ifcfg.me/',
+    'https://ip6.dnshome.de',
+]
+
+_PATTERN = re.compile(r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}')
+_PATTERN6 = re.compile(r'[:0-9a-fA-F]*:[:0-9a-fA-F]+')
+
+
+def find_address(text, version):
+    """
+    Return first valid address of given version (4 or 6) in text, or None.
+    """
+    pattern = _PATTERN if version == 4 else _PATTERN6
+    for match in pattern.finditer(text):
+        try:
+            addr = ipaddress.ip_address(match.group(0))
+        except ValueError:
+            continue
+        if addr.version == version:
+            return addr.compressed
+    return None
+
+
+def check_url(log, url, version, timeout):
+    """Return address reported by url or None."""
+    log.debug('trying ' + url)
+    try:
+        with urllib.request.urlopen(url, None, timeout) as response:
+            if response.getcode() != 200:
+                log.debug("Bad response at %s (ignored)", url)
+                return None
+            html = response.read().decode('utf-8', errors='replace')
+    except (urllib.error.URLError, OSError) as err:
+        log.debug("Error reading %s (ignored): %s", url, err)
+        return None
+    address = find_address(html, version)
+    if not address:
+        log.debug("Cannot parse address reply from %s", url)
+    return address
+
+
+class ConsensusWebPlugin(AddressPlugin):
+    """
+    Get the external address as agreed upon by several web services.
+
+    All sources are queried concurrently. An address is accepted only
+    if at least quorum sources report the very same address. Sources
+    reporting something else, typically a proxy address or a captive
+    portal, are logged as dissenting. If no address reaches the quorum
+    the lookup fails and nothing is updated.
+
+    The default sources are the ones used by default-web-ip and
+    ip.dnshome.de, or default-web-ip6 and ip.dnshome.de if the ip6
+    option is used.
+
+    Options:
+        urls=url1,url2,...   Comma-separated list of sources.
+        quorum=k             Number of sources which must agree, default
+                             is a majority of the sources.
+        timeout=seconds      Timeout for each source, default 20.
+        ip6                  Look for an ipv6 address instead of ipv4.
+    """
+
+    _name = 'consensus-web-ip'
+    _oneliner = 'Obtain external address agreed upon by several services'
+
+    def get_ip(self, log, options):
+        """Implement AddressPlugin.get_ip()."""
+        opts = dict_of_opts(options)
+        version = 6 if 'ip6' in opts else 4
+        if 'urls' in opts:
+            urls = [url for url in opts['urls'].split(',') if url]
+        else:
+            urls = _URLS6 if version == 6 else _URLS
+        try:
+            quorum = int(opts.get('quorum', len(urls) // 2 + 1))
+            timeout = float(opts.get('timeout', TIMEOUT))
+        except ValueError:
+            raise AddressError("Bad quorum or timeout option") from None
+        if quorum < 1 or quorum > len(urls):
+            raise AddressError(
+                "quorum must be in range 1..%d (got %d)" % (len(urls), quorum))
+
+        with concurrent.futures.ThreadPoolExecutor(len(urls)) as executor:
+            futures = [executor.submit(check_url, log, url, version, timeout)
+                       for url in urls]
+            replies = list(zip(urls, [f.result() for f in futures]))
+
+        votes = {}
+        for url, address in replies:
+            if address:
+                votes.setdefault(address, []).append(url)
+        log.debug("Votes: %s", votes)
+        if not votes:
+            raise AddressError("No source reported an address: %s" % replies)
+        address, voters = max(votes.items(), key=lambda v: len(v[1]))
+        if len(voters) < quorum:
+            raise AddressError(
+                "No address reported by at least %d sources: %s"
+                % (quorum, replies))
+        if [v for v in votes.values() if len(v) >= quorum and v != voters]:
+            raise AddressError(
+                "Several addresses reach quorum %d: %s" % (quorum, replies))
+        dissenters = [(url, reply) for url, reply in replies
+                      if reply != address]
+        if dissenters:
+            log.warning("Sources disagreeing on %s: %s", address, dissenters)
+        log.debug("Address %s confirmed by %s", address, ', '.join(voters))
+        return IpAddr(None, address) if version == 6 else IpAddr(address)
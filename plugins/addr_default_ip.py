@@ -45,7 +45,5 @@ class DefaultIfPLugin(AddressPlugin):
                 break
         if if_ is None:
             raise AddressError("Cannot find default interface, giving up")
-        address = IpAddr()
         output = subprocess.getoutput('ip address show dev ' + if_)
-        address.parse_ifconfig_output(output)
-        return address
+        return IpAddr.from_ifconfig_output(output)
@@ -9,6 +9,7 @@ import re
 
 from ddupdate.ddplugin import AddressPlugin, AddressError, IpAddr
 
+TIMEOUT = 20
 
 _URLS = [
     'http://checkip.dyndns.org/',
@@ -36,9 +37,9 @@ class DefaultWebPlugin(AddressPlugin):
             """Get reply from host and decode."""
             log.debug('trying ' + url)
             try:
-                with urllib.request.urlopen(url) as response:
+                with urllib.request.urlopen(url, None, TIMEOUT) as response:
                     html = response.read().decode('utf-8')
-            except (urllib.error.HTTPError, urllib.error.URLError):
+            except OSError:     # URLError, HTTPError and read timeouts
                 log.debug("Bad response at %s (ignored)" % url)
                 return None
             log.debug("Got response: %s", html)
@@ -52,7 +53,10 @@ class DefaultWebPlugin(AddressPlugin):
         for ix, url in enumerate(_URLS):
             ip = check_url(url)
             if ip:
-                return IpAddr(ip)
+                try:
+                    return IpAddr(ip)
+                except AddressError:
+                    log.debug("Invalid address %s (ignored)", ip)
             if ix + 1 < len(_URLS):
                 log.info("Falling back to %s", _URLS[ix + 1])
         raise AddressError(
@@ -57,7 +57,10 @@ class DefaultWeb6Plugin(AddressPlugin):
             log.info('Trying: %s', url)
             ip = check_url(url)
             if ip:
-                return IpAddr(None, ip)
+                try:
+                    return IpAddr(None, ip)
+                except AddressError:
+                    log.debug("Invalid address %s (ignored)", ip)
             if ix + 1 < len(urls):
                 log.info("Falling back to %s", urls[ix + 1])
         raise AddressError(
@@ -0,0 +1,137 @@
+"""
+ddupdate plugin retrieving the external address using a DNS query.
+
+See: ddupdate(8)
+"""
+
+import concurrent.futures
+import ipaddress
+import socket
+
+from ddupdate.ddplugin import AddressPlugin, AddressError, IpAddr
+from ddupdate.ddplugin import dict_of_opts
+from ddupdate import dnswire
+
+TIMEOUT = 2
+
+# ns1.google.com and ns2.google.com, answering o-o.myaddr.l.google.com
+_SERVERS = ['216.239.32.10', '216.239.34.10']
+_SERVERS6 = ['2001:4860:4802:32::a', '2001:4860:4802:34::a']
+
+_FAMILIES = {'v4': [4], 'v6': [6], 'all': [4, 6]}
+
+
+def find_address(records, version):
+    """Return first address of given version (4, 6) in records, or None."""
+    for record in records:
+        for text in record.text():
+            for word in text.split():
+                try:
+                    addr = ipaddress.ip_address(word)
+                except ValueError:
+                    continue
+                if addr.version == version:
+                    return addr.compressed
+    return None
+
+
+def query(log, servers, version, opts):
+    """
+    Query servers in turn over ipv4 or ipv6 (version 4 or 6).
+
+    Returns the first address of the same version found in a reply,
+    or None.
+    """
+    family = socket.AF_INET if version == 4 else socket.AF_INET6
+    rtype = opts['type']
+    if rtype == dnswire.TYPE_A and version == 6:
+        rtype = dnswire.TYPE_AAAA
+    for server in servers:
+        msg = dnswire.make_query(opts['name'], rtype, opts['class'])
+        log.debug("Querying %s for %s", server, opts['name'])
+        try:
+            reply = dnswire.exchange(msg, server, opts['timeout'],
+                                     family=family)
+        except dnswire.DnsError as err:
+            log.debug("Query failed (ignored): %s", err)
+            continue
+        if reply.rcode != 0:
+            log.debug("Bad reply from %s: %s", server, reply.rcode_text())
+            continue
+        address = find_address(reply.answers, version)
+        if address:
+            log.debug("Got %s from %s", address, server)
+            return address
+        log.debug("No ipv%d address in reply from %s", version, server)
+    return None
+
+
+class DnsQueryPlugin(AddressPlugin):
+    """
+    Get the external address using a DNS query.
+
+    Some DNS servers answers a query for a special name with the address
+    the query came from. By default, this uses the TXT record
+    o-o.myaddr.l.google.com asked directly to ns1.google.com.
+    Other examples:
+
+        - name=myip.opendns.com type=A servers=208.67.222.222
+          servers6=2620:119:35::35
+        - name=whoami.cloudflare type=TXT class=CH servers=1.1.1.1
+          servers6=2606:4700:4700::1111
+
+    The ipv4 address is retrieved by querying the servers option over
+    ipv4, the ipv6 one by querying servers6 over ipv6. Servers are
+    tried in order until one of them answers.
+
+    Options:
+        name=domain name        Name to query.
+        type=TXT|A              Record type, A implies AAAA for ipv6.
+        class=IN|CH             Query class, default IN.
+        servers=addr,...        Servers used for ipv4, an address may be
+                                followed by :port.
+        servers6=addr,...       Servers used for ipv6, like [::1]:53.
+        family=v4|v6|all        Address(es) to look up, default v4.
+        timeout=seconds         Timeout for each server, default 2.
+    """
+
+    _name = 'dns-query'
+    _oneliner = 'Obtain external address using a DNS query'
+
+    def get_ip(self, log, options):
+        """Implement AddressPlugin.get_ip()."""
+        opts = dict_of_opts(options)
+        family = opts.get('family', 'v4')
+        if family not in _FAMILIES:
+            raise AddressError("Bad family option: " + family)
+        rtype = opts.get('type', 'TXT').upper()
+        rclass = opts.get('class', 'IN').upper()
+        if rtype not in ['A', 'AAAA', 'TXT'] \
+                or rclass not in dnswire.CLASSES:
+            raise AddressError("Bad type or class option")
+        try:
+            timeout = float(opts.get('timeout', TIMEOUT))
+        except ValueError:
+            raise AddressError("Bad timeout option") from None
+        query_opts = {
+            'name': opts.get('name', 'o-o.myaddr.l.google.com'),
+            'type': dnswire.TYPES['A' if rtype == 'AAAA' else rtype],
+            'class': dnswire.CLASSES[rclass],
+            'timeout': timeout
+        }
+        servers = {
+            4: opts['servers'].split(',') if 'servers' in opts
+            else _SERVERS,
+            6: opts['servers6'].split(',') if 'servers6' in opts
+            else _SERVERS6
+        }
+        versions = _FAMILIES[family]
+        with concurrent.futures.ThreadPoolExecutor(len(versions)) as executor:
+            futures = {v: executor.submit(query, log, servers[v], v,
+                                          query_opts)
+                       for v in versions}
+            found = {v: f.result() for v, f in futures.items()}
+        if not any(found.values()):
+            raise AddressError(
+                "Cannot obtain address from %s" % query_opts['name'])
+        return IpAddr(found.get(4), found.get(6))
@@ -105,9 +105,6 @@ class DeDnshomeWebPlugin(AddressPlugin):
         for url in urls:
             result = DeDnshomeWebPlugin.load_ip(log, url.value)
             if result:
-                if not ip.v4 and result.v4:
-                    ip.v4 = result.v4
-                if not ip.v6 and result.v6:
-                    ip.v6 = result.v6
+                ip = IpAddr(ip.v4 or result.v4, ip.v6 or result.v6)
         log.debug("Returning ip: " + str(ip))
         return ip if not ip.empty() else None
@@ -26,7 +26,5 @@ class HardcodedIfPlugin(AddressPlugin):
         if 'if' not in opts:
             raise AddressError('Required option if= missing, giving up.')
         if_ = opts['if']
-        address = IpAddr()
         output = subprocess.getoutput('ip address show dev ' + if_)
-        address.parse_ifconfig_output(output)
-        return address
+        return IpAddr.from_ifconfig_output(output)
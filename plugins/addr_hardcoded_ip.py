@@ -21,13 +21,8 @@ class HardcodedIfPlugin(AddressPlugin):
 
     def get_ip(self, log, options):
         """Implement AddressPlugin.get_ip()."""
-        addr = IpAddr()
         opts = dict_of_opts(options)
         if 'ip' not in opts and 'ip6' not in opts:
             raise AddressError(
                 'Required option ip= or ip6= missing, giving up.')
-        if 'ip' in opts:
-            addr.v4 = opts['ip']
-        if 'ip6' in opts:
-            addr.v6 = opts['ip6']
-        return addr
+        return IpAddr(opts.get('ip'), opts.get('ip6'))
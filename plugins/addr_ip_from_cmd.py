@@ -5,12 +5,124 @@ See: ddupdate(8)
 
 """
 
+import atexit
+import os
 import re
+import select
 import subprocess
+import time
 
 from ddupdate.ddplugin import \
     AddressPlugin, AddressError, IpAddr, dict_of_opts
 
+TIMEOUT = 60
+
+# Running coprocesses, keyed by command.
+_coprocesses = {}
+
+
+def parse_output(result):
+    """Return IpAddr parsed from command output, raise AddressError."""
+    pat = re.compile(r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}')
+    pat6 = re.compile(r'[:0-9a-f]{12,}(\s|\Z)')
+    v4 = None
+    v6 = None
+    for word in result.split():
+        if pat.fullmatch(word):
+            v4 = word
+        elif pat6.fullmatch(word):
+            v6 = word
+        else:
+            raise AddressError(
+                'Cannot parse command output: ' + result)
+    return IpAddr(v4, v6)
+
+
+def run_command(log, cmd, timeout):
+    """Run cmd once in a shell, return it's output."""
+    log.debug('Running: %s', cmd)
+    try:
+        proc = subprocess.run(
+            cmd, shell=True, timeout=timeout, check=False,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    except subprocess.TimeoutExpired:
+        raise AddressError(
+            'Timeout (%s s) running: %s' % (timeout, cmd)) from None
+    return proc.stdout.decode('utf-8', errors='replace').strip()
+
+
+class _Coprocess:
+    """A long-lived command answering one line for each request line."""
+
+    def __init__(self, cmd):
+        self.cmd = cmd
+        self.proc = None
+        self.buffer = b''
+
+    def start(self, log):
+        """Start the command unless running."""
+        if self.proc and self.proc.poll() is None:
+            return
+        log.debug('Starting coprocess: %s', self.cmd)
+        self.buffer = b''
+        # pylint: disable=consider-using-with
+        self.proc = subprocess.Popen(
+            self.cmd, shell=True, bufsize=0,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def stop(self):
+        """Terminate the command if running."""
+        if not self.proc:
+            return
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+        self.proc.stdin.close()
+        self.proc.stdout.close()
+        self.proc = None
+
+    def _readline(self, timeout):
+        """Return next line from stdout, or None on EOF."""
+        deadline = time.monotonic() + timeout
+        fd = self.proc.stdout.fileno()
+        while b'\n' not in self.buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                self.stop()
+                raise AddressError(
+                    'Timeout (%s s) waiting for: %s' % (timeout, self.cmd))
+            data = os.read(fd, 4096)
+            if not data:
+                return None
+            self.buffer += data
+        line, self.buffer = self.buffer.split(b'\n', 1)
+        return line.decode('utf-8', errors='replace').strip()
+
+    def request(self, log, timeout):
+        """Send a request line, return the reply line."""
+        for attempt in range(2):
+            self.start(log)
+            try:
+                self.proc.stdin.write(b'address\n')
+                reply = self._readline(timeout)
+            except (BrokenPipeError, ConnectionResetError):
+                reply = None
+            if reply is not None:
+                return reply
+            log.warning('Coprocess exited: %s%s', self.cmd,
+                        ', restarting' if attempt == 0 else '')
+            self.stop()
+        raise AddressError('Coprocess does not respond: ' + self.cmd)
+
+
+def _stop_all():
+    """Terminate all running coprocesses."""
+    for coprocess in _coprocesses.values():
+        coprocess.stop()
+
+
+atexit.register(_stop_all)
+
 
 class IpFromCmdPlugin(AddressPlugin):
     """
@@ -26,8 +138,17 @@ class IpFromCmdPlugin(AddressPlugin):
 
     The command invoked is specified in the cmd option
 
+    Using the coprocess option the command is instead started once and
+    kept running. For each lookup ddupdate writes a line containing
+    'address' on the command's stdin, and the command should reply with
+    a single line on stdout formatted as above. A command which exits
+    is restarted. This avoids starting the command for each lookup when
+    ddupdate handles many sections or runs for a long time.
+
     Options:
         cmd=command
+        timeout=seconds   Max time to wait for a reply, default 60.
+        coprocess         Keep command running, see above.
 
     netrc:
         Nothing
@@ -42,18 +163,15 @@ class IpFromCmdPlugin(AddressPlugin):
         if 'cmd' not in opts:
             raise AddressError('Required option cmd= missing, giving up.')
         cmd = opts['cmd']
-        log.debug('Running: %s', cmd)
-        addr = IpAddr()
-        result = subprocess.getoutput(cmd).strip()
+        try:
+            timeout = float(opts.get('timeout', TIMEOUT))
+        except ValueError:
+            raise AddressError('Bad timeout option: ' + opts['timeout']) \
+                from None
+        if 'coprocess' in opts:
+            coprocess = _coprocesses.setdefault(cmd, _Coprocess(cmd))
+            result = coprocess.request(log, timeout)
+        else:
+            result = run_command(log, cmd, timeout)
         log.debug('result: %s', result)
-        pat = re.compile(r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}')
-        pat6 = re.compile(r'[:0-9a-f]{12,}(\s|\Z)')
-        for word in result.split():
-            if pat.fullmatch(word):
-                addr.v4 = word
-            elif pat6.fullmatch(word):
-                addr.v6 = word
-            else:
-                raise AddressError(
-                    'Cannot parse command output: ' + result)
-        return addr
+        return parse_output(result)
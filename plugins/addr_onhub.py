@@ -13,6 +13,8 @@ from ddupdate.ddplugin import AddressPlugin, AddressError, IpAddr
 # onhub.here should resolve correctly if you have this type of router
 _URL = "http://onhub.here/api/v1/status"
 
+TIMEOUT = 20
+
 
 class OnHubPlugin(AddressPlugin):
     """
@@ -31,13 +33,13 @@ class OnHubPlugin(AddressPlugin):
         # pylint: disable=raise-missing-from
         log.debug("trying " + _URL)
         try:
-            with urllib.request.urlopen(_URL) as response:
+            with urllib.request.urlopen(_URL, None, TIMEOUT) as response:
                 if response.getcode() != 200:
                     raise AddressError(
                         "Bad response %s from %s" % (response.getcode(), _URL)
                     )
                 status = json.loads(response.read().decode("utf-8"))
-        except (urllib.error.HTTPError, urllib.error.URLError) as err:
+        except OSError as err:  # URLError, HTTPError and read timeouts
             raise AddressError("Error reading %s :%s" % (_URL, err))
         log.debug("Got response: %s", json.dumps(status))
 
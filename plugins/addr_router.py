@@ -0,0 +1,261 @@
+"""
+ddupdate plugin asking the router for it's external address.
+
+See: ddupdate(8)
+See: RFC 6886 (NAT-PMP), UPnP IGD WANIPConnection
+"""
+
+import http.client
+import ipaddress
+import select
+import socket
+import struct
+import subprocess
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import xml.etree.ElementTree as ET
+
+from ddupdate.ddplugin import AddressPlugin, AddressError, IpAddr
+from ddupdate.ddplugin import dict_of_opts, split_host_port
+
+TIMEOUT = 2
+
+NATPMP_PORT = 5351
+
+_SSDP_ADDR = ('239.255.255.250', 1900)
+_IGD_TYPE = 'urn:schemas-upnp-org:device:InternetGatewayDevice:1'
+_WAN_SERVICES = ['WANIPConnection', 'WANPPPConnection']
+
+_SOAP_BODY = """<?xml version="1.0"?>
+<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/"
+ s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/">
+<s:Body><u:GetExternalIPAddress xmlns:u="%s"/></s:Body>
+</s:Envelope>
+"""
+
+
+def find_gateway():
+    """Return ipv4 address of default gateway, or None."""
+    try:
+        with open('/proc/net/route') as f:
+            for line in f.readlines()[1:]:
+                words = line.split()
+                if len(words) > 3 and words[1] == '00000000' \
+                        and int(words[3], 16) & 0x2:
+                    packed = struct.pack('<I', int(words[2], 16))
+                    return str(ipaddress.IPv4Address(packed))
+    except (OSError, ValueError):
+        pass
+    for line in subprocess.getoutput('ip route').split('\n'):
+        words = line.split()
+        if len(words) > 2 and words[0] == 'default' and words[1] == 'via':
+            return words[2]
+    return None
+
+
+def natpmp_address(log, gateway, port, timeout):
+    """
+    Return external address using a NAT-PMP request, or None.
+
+    Routers implementing PCP (RFC 6887) answers this as well when
+    supporting the NAT-PMP backwards compatibility.
+    """
+    log.debug("Trying NAT-PMP at %s:%d", gateway, port)
+    deadline = time.monotonic() + timeout
+    interval = 0.25
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        try:
+            sock.connect((gateway, port))
+        except OSError as err:
+            log.debug("Cannot connect to %s: %s", gateway, err)
+            return None
+        while time.monotonic() < deadline:
+            try:
+                sock.send(b'\x00\x00')
+            except OSError as err:
+                log.debug("NAT-PMP send error: %s", err)
+                return None
+            wait = min(interval, deadline - time.monotonic())
+            interval *= 2
+            if not select.select([sock], [], [], max(wait, 0))[0]:
+                continue
+            try:
+                data = sock.recv(64)
+            except OSError as err:
+                log.debug("NAT-PMP receive error: %s", err)
+                return None
+            if len(data) < 12 or data[:2] != b'\x00\x80':
+                log.debug("Unsupported NAT-PMP reply: %s", data.hex())
+                return None
+            result = struct.unpack('!H', data[2:4])[0]
+            if result != 0:
+                log.debug("NAT-PMP error result: %d", result)
+                return None
+            return str(ipaddress.IPv4Address(data[8:12]))
+    log.debug("No NAT-PMP reply from %s", gateway)
+    return None
+
+
+def ssdp_location(log, gateway, timeout):
+    """Return description url for the IGD, preferably on gateway."""
+    request = '\r\n'.join([
+        'M-SEARCH * HTTP/1.1',
+        'HOST: %s:%d' % _SSDP_ADDR,
+        'MAN: "ssdp:discover"',
+        'MX: %d' % max(1, int(timeout)),
+        'ST: ' + _IGD_TYPE,
+        '', ''
+    ]).encode('ascii')
+    locations = []
+    deadline = time.monotonic() + timeout
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        try:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
+            sock.sendto(request, _SSDP_ADDR)
+        except OSError as err:
+            log.debug("Cannot send SSDP request: %s", err)
+            return None
+        while time.monotonic() < deadline:
+            wait = deadline - time.monotonic()
+            if not select.select([sock], [], [], max(wait, 0))[0]:
+                break
+            try:
+                data, source = sock.recvfrom(4096)
+            except OSError as err:
+                log.debug("SSDP receive error: %s", err)
+                break
+            for line in data.decode('utf-8', 'replace').split('\r\n'):
+                key, _, value = line.partition(':')
+                if key.strip().lower() == 'location':
+                    log.debug("SSDP location from %s: %s", source[0], value)
+                    if source[0] == gateway:
+                        return value.strip()
+                    locations.append(value.strip())
+    return locations[0] if locations else None
+
+
+def _local_name(tag):
+    """Return tag without xml namespace."""
+    return tag.rsplit('}', 1)[-1]
+
+
+def igd_control_url(log, location, timeout):
+    """Return (control url, service type) for the WAN connection."""
+    with urllib.request.urlopen(location, None, timeout) as response:
+        root = ET.fromstring(response.read())
+    base = location
+    for elem in root.iter():
+        if _local_name(elem.tag) == 'URLBase' and elem.text:
+            base = elem.text.strip()
+    for elem in root.iter():
+        if _local_name(elem.tag) != 'service':
+            continue
+        fields = {_local_name(e.tag): (e.text or '').strip() for e in elem}
+        stype = fields.get('serviceType', '')
+        if [s for s in _WAN_SERVICES if s in stype] \
+                and fields.get('controlURL'):
+            url = urllib.parse.urljoin(base, fields['controlURL'])
+            log.debug("IGD service %s at %s", stype, url)
+            return url, stype
+    return None, None
+
+
+def upnp_address(log, gateway, location, timeout):
+    """
+    Return external address using UPnP IGD GetExternalIPAddress, or None.
+
+    Devices on the LAN might answer the SSDP discovery with bogus data,
+    all errors are thus logged and reported as no address.
+    """
+    try:
+        if not location:
+            location = ssdp_location(log, gateway, timeout)
+        if not location:
+            log.debug("No UPnP IGD found")
+            return None
+        url, stype = igd_control_url(log, location, timeout)
+        if not url:
+            log.debug("No WAN connection service in %s", location)
+            return None
+        request = urllib.request.Request(
+            url, data=(_SOAP_BODY % stype).encode('utf-8'),
+            headers={
+                'Content-Type': 'text/xml; charset="utf-8"',
+                'SOAPAction': '"%s#GetExternalIPAddress"' % stype
+            })
+        with urllib.request.urlopen(request, None, timeout) as response:
+            root = ET.fromstring(response.read())
+    except (urllib.error.URLError, OSError, ValueError,
+            http.client.HTTPException, ET.ParseError) as err:
+        log.debug("UPnP error: %s", err)
+        return None
+    for elem in root.iter():
+        if _local_name(elem.tag) == 'NewExternalIPAddress' and elem.text:
+            return elem.text.strip()
+    log.debug("No address in UPnP reply")
+    return None
+
+
+class RouterPlugin(AddressPlugin):
+    """
+    Get the external ipv4 address from the router.
+
+    The router is asked using NAT-PMP, falling back to UPnP IGD if
+    there is no reply. Routers supporting PCP usually also answers
+    NAT-PMP requests. The router is by default the gateway in the
+    default route. All traffic stays in the local network.
+
+    Note that the router's external address is not necessarily the
+    address seen from the internet if the provider uses carrier grade
+    NAT. A warning is logged if the address is not a global one.
+
+    Options:
+        gateway=address[:port]  Router address and NAT-PMP port, defaults
+                                to default gateway and port 5351.
+        protocols=natpmp,upnp   Protocols to try, in order.
+        upnp-url=url            IGD description url, default is to find
+                                it using SSDP multicast.
+        timeout=seconds         Timeout for each protocol, default 2.
+    """
+
+    _name = 'router'
+    _oneliner = 'Obtain external address from router using NAT-PMP or UPnP'
+
+    def get_ip(self, log, options):
+        """Implement AddressPlugin.get_ip()."""
+        opts = dict_of_opts(options)
+        try:
+            timeout = float(opts.get('timeout', TIMEOUT))
+            if 'gateway' in opts:
+                gateway, port = split_host_port(opts['gateway'], NATPMP_PORT)
+            else:
+                gateway, port = find_gateway(), NATPMP_PORT
+        except ValueError:
+            raise AddressError("Bad timeout or gateway option") from None
+        if not gateway:
+            raise AddressError("Cannot find default gateway, giving up")
+        protocols = opts.get('protocols', 'natpmp,upnp').split(',')
+        for protocol in protocols:
+            if protocol == 'natpmp':
+                address = natpmp_address(log, gateway, port, timeout)
+            elif protocol == 'upnp':
+                address = upnp_address(
+                    log, gateway, opts.get('upnp-url'), timeout)
+            else:
+                raise AddressError("Unknown protocol: " + protocol)
+            if not address:
+                continue
+            try:
+                addr = ipaddress.IPv4Address(address)
+            except ValueError:
+                log.debug("Bad address from router: %s", address)
+                continue
+            if not addr.is_global:
+                log.warning("Router's external address %s is not global",
+                            address)
+            log.debug("Got %s using %s", address, protocol)
+            return IpAddr(str(addr))
+        raise AddressError(
+            "No address from router %s (%s tried)" % (gateway, protocols))
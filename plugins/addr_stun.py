@@ -0,0 +1,214 @@
+"""
+ddupdate plugin retrieving the external address using STUN.
+
+See: ddupdate(8)
+See: RFC 5389
+"""
+
+import ipaddress
+import os
+import select
+import socket
+import struct
+import time
+
+from ddupdate.ddplugin import AddressPlugin, AddressError, IpAddr
+from ddupdate.ddplugin import dict_of_opts, split_host_port
+
+TIMEOUT = 3
+
+_SERVERS = [
+    'stun.l.google.com:19302',
+    'stun1.l.google.com:19302',
+    'stun.cloudflare.com:3478',
+]
+
+_MAGIC_COOKIE = 0x2112A442
+_BINDING_REQUEST = 0x0001
+_BINDING_RESPONSE = 0x0101
+_MAPPED_ADDRESS = 0x0001
+_XOR_MAPPED_ADDRESS = 0x0020
+_XOR_MAPPED_ADDRESS_OLD = 0x8020
+
+_FAMILIES = {
+    'v4': [socket.AF_INET],
+    'v6': [socket.AF_INET6],
+    'all': [socket.AF_INET, socket.AF_INET6],
+}
+
+
+def binding_request(transaction_id):
+    """Return a STUN binding request with given 12 byte transaction id."""
+    return struct.pack('!HHI', _BINDING_REQUEST, 0, _MAGIC_COOKIE) \
+        + transaction_id
+
+
+def parse_response(data, transaction_id):
+    """
+    Parse a STUN binding response, return mapped address or None.
+
+    Responses not matching transaction_id are ignored.
+    """
+    if len(data) < 20:
+        return None
+    msg_type, length, cookie = struct.unpack('!HHI', data[:8])
+    if msg_type != _BINDING_RESPONSE or cookie != _MAGIC_COOKIE \
+            or data[8:20] != transaction_id:
+        return None
+    attrs = {}
+    pos = 20
+    end = min(len(data), 20 + length)
+    while pos + 4 <= end:
+        attr_type, attr_len = struct.unpack('!HH', data[pos:pos + 4])
+        attrs.setdefault(attr_type, data[pos + 4:pos + 4 + attr_len])
+        pos += 4 + (attr_len + 3) // 4 * 4
+    # A valid attribute is 4 header bytes + 4 or 16 address bytes.
+    for attr_type in [_XOR_MAPPED_ADDRESS, _XOR_MAPPED_ADDRESS_OLD]:
+        value = attrs.get(attr_type, b'')
+        if len(value) in [8, 20]:
+            key = data[4:20] if value[1] == 2 else data[4:8]
+            addr = bytes(a ^ b for a, b in zip(value[4:], key))
+            return _decode_address(value[1], addr)
+    value = attrs.get(_MAPPED_ADDRESS, b'')
+    if len(value) in [8, 20]:
+        return _decode_address(value[1], value[4:])
+    return None
+
+
+def _decode_address(family, packed):
+    """Return address string for a STUN family (1, 2) and packed address."""
+    try:
+        if family == 1 and len(packed) == 4:
+            return str(ipaddress.IPv4Address(packed))
+        if family == 2 and len(packed) == 16:
+            return str(ipaddress.IPv6Address(packed))
+    except ValueError:
+        pass
+    return None
+
+
+def resolve(log, servers, family):
+    """Return list of socket addresses for servers in given family."""
+    addresses = []
+    for server in servers:
+        try:
+            host, port = split_host_port(server, 3478)
+        except ValueError:
+            raise AddressError("Bad STUN server: " + server) from None
+        try:
+            infos = socket.getaddrinfo(host, port, family, socket.SOCK_DGRAM)
+        except OSError as err:
+            log.debug("Cannot resolve %s: %s", server, err)
+            continue
+        for info in infos:
+            if info[4] not in addresses:
+                addresses.append(info[4])
+    return addresses
+
+
+class _Query:
+    """Binding requests sent to all servers in one address family."""
+
+    def __init__(self, log, family, servers):
+        self.transaction_id = os.urandom(12)
+        self.targets = resolve(log, servers, family)
+        self.sock = None
+        if not self.targets:
+            return
+        try:
+            self.sock = socket.socket(family, socket.SOCK_DGRAM)
+        except OSError as err:
+            log.debug("Cannot create socket: %s", err)
+            self.sock = None
+
+    def send(self, log):
+        """Send request to all servers."""
+        request = binding_request(self.transaction_id)
+        for target in self.targets:
+            try:
+                self.sock.sendto(request, target)
+            except OSError as err:
+                log.debug("Cannot send to %s: %s", target[0], err)
+
+    def receive(self, log):
+        """Read a response, return mapped address or None."""
+        try:
+            data, source = self.sock.recvfrom(2048)
+        except OSError as err:
+            log.debug("Receive error: %s", err)
+            return None
+        if source[:2] not in [t[:2] for t in self.targets]:
+            return None
+        address = parse_response(data, self.transaction_id)
+        log.debug("Got %s from %s", address, source[0])
+        return address
+
+    def close(self):
+        """Close socket."""
+        if self.sock:
+            self.sock.close()
+
+
+class StunPlugin(AddressPlugin):
+    """
+    Get the external address using a STUN binding request.
+
+    A binding request is sent over UDP to all configured servers at
+    once, the first valid reply is used. Requests are retransmitted
+    until the timeout expires.
+
+    Options:
+        servers=host:port,...   Comma-separated list of servers, port
+                                defaults to 3478. Use brackets around
+                                ipv6 addresses like [::1]:3478.
+        family=v4|v6|all        Address(es) to look up, default v4.
+        timeout=seconds         Max time to wait for a reply, default 3.
+    """
+
+    _name = 'stun'
+    _oneliner = 'Obtain external address using STUN (RFC 5389)'
+
+    def get_ip(self, log, options):
+        """Implement AddressPlugin.get_ip()."""
+        opts = dict_of_opts(options)
+        servers = _SERVERS
+        if 'servers' in opts:
+            servers = [s for s in opts['servers'].split(',') if s]
+        family = opts.get('family', 'v4')
+        if family not in _FAMILIES:
+            raise AddressError("Bad family option: " + family)
+        try:
+            timeout = float(opts.get('timeout', TIMEOUT))
+        except ValueError:
+            raise AddressError("Bad timeout option") from None
+
+        queries = [_Query(log, f, servers) for f in _FAMILIES[family]]
+        pending = {q.sock: q for q in queries if q.sock}
+        found = {}
+        deadline = time.monotonic() + timeout
+        retransmit = time.monotonic()
+        interval = 0.5
+        try:
+            while pending:
+                now = time.monotonic()
+                if now >= deadline:
+                    break
+                if now >= retransmit:
+                    for query in pending.values():
+                        query.send(log)
+                    retransmit = now + interval
+                    interval *= 2
+                wait = min(deadline, retransmit) - now
+                readable = select.select(list(pending), [], [], wait)[0]
+                for sock in readable:
+                    address = pending[sock].receive(log)
+                    if address:
+                        found[sock.family] = address
+                        del pending[sock]
+        finally:
+            for query in queries:
+                query.close()
+        if not found:
+            raise AddressError(
+                "No STUN reply from: %s" % ', '.join(servers))
+        return IpAddr(found.get(socket.AF_INET), found.get(socket.AF_INET6))
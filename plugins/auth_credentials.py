@@ -0,0 +1,134 @@
+"""
+Implement credentials lookup using files and environment variables.
+
+Each machine has its own file or variables, so a lookup just reads a
+single value without any parsing or communication with other processes.
+"""
+import os
+import os.path
+import re
+
+from ddupdate.ddplugin import AuthPlugin, AuthError
+
+
+def _env_name(prefix, machine):
+    """Return environment variable name for machine."""
+    return prefix + re.sub('[^A-Z0-9]', '_', machine.upper())
+
+
+def _credentials_dirs():
+    """Return list of directories to search, in order."""
+    dirs = []
+    if os.environ.get('CREDENTIALS_DIRECTORY'):
+        dirs.append(os.environ['CREDENTIALS_DIRECTORY'])
+    dirs.append(_user_dir())
+    return dirs
+
+
+def _user_dir():
+    """Return the writable credentials directory."""
+    if os.environ.get('DDUPDATE_CREDENTIALS'):
+        return os.environ['DDUPDATE_CREDENTIALS']
+    config_home = os.environ.get('XDG_CONFIG_HOME',
+                                 os.path.expanduser('~/.config'))
+    return os.path.join(config_home, 'ddupdate', 'credentials')
+
+
+def _check_machine(machine):
+    """Raise AuthError if machine cannot be used as a file name."""
+    if not machine or '/' in machine or machine.startswith('.'):
+        raise AuthError("Illegal machine name: " + machine)
+
+
+class AuthCredentials(AuthPlugin):
+    """Get credentials from files or environment variables.
+
+    Intended for servers where neither a shared .netrc file nor a keyring
+    is desirable. For a machine like api.cloudflare.com the sources are,
+    in order:
+
+      - The DDUPDATE_PASSWORD_API_CLOUDFLARE_COM environment variable and
+        optionally DDUPDATE_LOGIN_API_CLOUDFLARE_COM, the machine name
+        uppercased and non-alphanumeric characters replaced by '_'.
+        Without the login variable, the username is taken from the file
+        below, if any.
+      - The file api.cloudflare.com in $CREDENTIALS_DIRECTORY, as set up by
+        the systemd LoadCredential= and SetCredentialEncrypted= options.
+      - The file api.cloudflare.com in the directory $DDUPDATE_CREDENTIALS,
+        by default ~/.config/ddupdate/credentials.
+
+    A file contains either just the password or api key on a single
+    line, or the username on the first line and the password on the
+    second. set_password() writes files in the last directory.
+    """
+
+    _name = 'credentials'
+    _oneliner = 'Read credentials from files or environment variables'
+
+    def get_auth(self, machine):
+        """Implement AuthPlugin::get_auth()."""
+        machine = machine.lower()
+        password = os.environ.get(_env_name('DDUPDATE_PASSWORD_', machine))
+        if password:
+            login = os.environ.get(_env_name('DDUPDATE_LOGIN_', machine))
+            if not login:
+                try:
+                    login = self._read_file(machine)[0]
+                except AuthError:
+                    login = None
+            return login if login else None, password
+        return self._read_file(machine)
+
+    @staticmethod
+    def _read_file(machine):
+        """Return (username, password) from first file found for machine."""
+        _check_machine(machine)
+        for directory in _credentials_dirs():
+            try:
+                with open(os.path.join(directory, machine)) as f:
+                    lines = [line.rstrip('\r\n') for line in f.readlines()]
+            except FileNotFoundError:
+                continue
+            except OSError as err:
+                raise AuthError(
+                    "Cannot read credentials for %s: %s" % (machine, err)) \
+                    from None
+            lines = [line for line in lines if line]
+            if len(lines) == 1:
+                return None, lines[0]
+            if len(lines) == 2:
+                return lines[0], lines[1]
+            raise AuthError("Cannot parse credentials file for " + machine)
+        raise AuthError("No credentials found for " + machine)
+
+    def get_passwords(self, machines=None):
+        """Implement AuthPlugin::get_passwords()."""
+        names = set()
+        for directory in _credentials_dirs():
+            try:
+                names.update(os.listdir(directory))
+            except OSError:
+                continue
+        result = []
+        for machine in sorted(names):
+            if machine.startswith('.') or machine != machine.lower():
+                continue
+            result.append((machine,) + self.get_auth(machine))
+        return result
+
+    def set_password(self, machine, username, password):
+        """Implement AuthPlugin::set_password()."""
+        machine = machine.lower()
+        _check_machine(machine)
+        directory = _user_dir()
+        text = (username + '\n' if username else '') + password + '\n'
+        try:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+            path = os.path.join(directory, machine)
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                f.write(text)
+        except OSError as err:
+            raise AuthError(
+                "Cannot store credentials for %s: %s" % (machine, err)) \
+                from None
@@ -7,8 +7,17 @@ is 'username<tab>password'
 
 For hosts using just an api key i. e., without a username the username
 field is set to 'api-key'
+
+Retrieved credentials are kept in memory for CACHE_TTL seconds and
+dropped when the process exits. prefetch() retrieves the credentials
+for all configured sections when a run starts. In daemon mode they are
+kept in memory until the next run, i. e., CACHE_TTL seconds plus the
+longest check interval.
 """
 
+import atexit
+import time
+
 
 KEYRING_MISSING_MSG = """
 python keyring module not found. Please install python3-keyring
@@ -26,6 +35,35 @@ except (ModuleNotFoundError, ImportError):
     print(KEYRING_MISSING_MSG)
     sys.exit(1)
 
+CACHE_TTL = 600
+
+# Credentials in memory: machine -> (expiry time, 'user<tab>password')
+_credentials = {}
+
+# Seconds to keep credentials in memory, see prefetch().
+_ttl = CACHE_TTL
+
+
+def _wipe():
+    """Drop all credentials kept in memory."""
+    _credentials.clear()
+
+
+atexit.register(_wipe)
+
+
+def _lookup(machine):
+    """Return credentials string for machine, possibly cached, or None."""
+    now = time.monotonic()
+    for key in [k for k, v in _credentials.items() if v[0] <= now]:
+        del _credentials[key]
+    if machine in _credentials:
+        return _credentials[machine][1]
+    credentials = keyring.get_password('ddupdate', machine)
+    if credentials:
+        _credentials[machine] = (now + _ttl, credentials)
+    return credentials
+
 
 class AuthKeyring(AuthPlugin):
     """Implement credentials lookup using python3-keyring.
@@ -47,7 +85,7 @@ class AuthKeyring(AuthPlugin):
     def get_auth(self, machine):
         """Implement AuthPlugin::get_auth()."""
         try:
-            credentials = keyring.get_password('ddupdate', machine.lower())
+            credentials = _lookup(machine.lower())
             if not credentials:
                 raise AuthError("Cannot get authentication for: " + machine)
             credentials = credentials.split('\t')
@@ -60,12 +98,51 @@ class AuthKeyring(AuthPlugin):
             credentials[0] = None
         return credentials[0], credentials[1]
 
-    def set_password(self, machine, username, password):
-        """Implement AuthPlugin::set_password()."""
-        if not username:
-            username = 'api-key'
-        credentials = username + '\t' + password
+    def prefetch(self, log, machines, ttl=None):
+        """Implement AuthPlugin::prefetch()."""
+        # pylint: disable=global-statement
+        global _ttl
+        _ttl = CACHE_TTL + (ttl if ttl else 0)
         try:
-            keyring.set_password('ddupdate', machine.lower(), credentials)
+            for machine in machines:
+                _lookup(machine.lower())
         except keyring.errors.KeyringError as err:
-            raise AuthError("Cannot set credentials for: " + machine) from err
+            log.debug("Cannot prefetch credentials: %s", err)
+            return
+        log.debug("Prefetched credentials for %d machine(s)", len(machines))
+
+    def set_password(self, machine, username, password):
+        """Implement AuthPlugin::set_password()."""
+        self.set_passwords([(machine, username, password)])
+
+    def set_passwords(self, credentials):
+        """
+        Implement AuthPlugin::set_passwords().
+
+        The keyring backend is looked up once and used for all entries.
+        """
+        backend = keyring.get_keyring()
+        for machine, username, password in credentials:
+            machine = machine.lower()
+            value = (username if username else 'api-key') + '\t' + password
+            _credentials.pop(machine, None)
+            try:
+                backend.set_password('ddupdate', machine, value)
+            except keyring.errors.KeyringError as err:
+                raise AuthError("Cannot set credentials for: " + machine) \
+                    from err
+
+    def get_passwords(self, machines=None):
+        """
+        Implement AuthPlugin::get_passwords().
+
+        The keyring cannot be searched, so this only returns credentials
+        for the given machines, normally those of the configured sections.
+        """
+        result = []
+        for machine in sorted({m.lower() for m in machines or []}):
+            try:
+                result.append((machine,) + self.get_auth(machine))
+            except AuthError:
+                continue
+        return result
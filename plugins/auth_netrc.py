@@ -5,9 +5,47 @@ import base64
 import binascii
 from netrc import netrc
 import os.path
+import tempfile
 
 from ddupdate.ddplugin import AuthPlugin, AuthError
 
+# Parsed netrc files: path -> (file signature, {machine: entry})
+_netrc_cache = {}
+
+
+def _netrc_hosts(path):
+    """Return netrc(path).hosts, parsing the file only if changed."""
+    try:
+        st = os.stat(path)
+    except OSError as err:
+        raise AuthError("Cannot access %s: %s" % (path, err)) from None
+    signature = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+    if path in _netrc_cache and _netrc_cache[path][0] == signature:
+        return _netrc_cache[path][1]
+    hosts = netrc(path).hosts
+    _netrc_cache[path] = (signature, hosts)
+    return hosts
+
+
+def _netrc_path():
+    """Return path to the netrc file in use."""
+    path = os.environ.get('NETRC', '')
+    if path:
+        return path
+    if os.path.exists(os.path.expanduser('~/.netrc')):
+        return os.path.expanduser('~/.netrc')
+    if os.path.exists('/etc/netrc'):
+        return '/etc/netrc'
+    raise AuthError("Cannot locate the netrc file (see manpage).")
+
+
+def _decode(password):
+    """Return password, base64-decoded if possible."""
+    try:
+        return base64.b64decode(password).decode('ascii')
+    except (binascii.Error, UnicodeDecodeError):
+        return password
+
 
 class AuthNetrc(AuthPlugin):
     """Get credentials stored in the .netrc(5) file.
@@ -23,39 +61,39 @@ class AuthNetrc(AuthPlugin):
 
     def get_auth(self, machine):
         """Implement AuthPlugin::get_auth()."""
-        path = os.environ.get('NETRC', '')
-        if path:
-            pass
-        elif os.path.exists(os.path.expanduser('~/.netrc')):
-            path = os.path.expanduser('~/.netrc')
-        elif os.path.exists('/etc/netrc'):
-            path = '/etc/netrc'
-        else:
-            raise AuthError("Cannot locate the netrc file (see manpage).")
-        auth = netrc(path).authenticators(machine)
+        hosts = _netrc_hosts(_netrc_path())
+        auth = hosts.get(machine, hosts.get('default'))
         if not auth:
             raise AuthError("No .netrc data found for " + machine)
         if not auth[2]:
             raise AuthError("No password found for " + machine)
-        try:
-            pw = base64.b64decode(auth[2]).decode('ascii')
-        except (binascii.Error, UnicodeDecodeError):
-            pw = auth[2]
-        return auth[0], pw
+        return auth[0], _decode(auth[2])
+
+    def get_passwords(self, machines=None):
+        """Implement AuthPlugin::get_passwords()."""
+        hosts = _netrc_hosts(_netrc_path())
+        return [(machine, auth[0] if auth[0] else None, _decode(auth[2]))
+                for machine, auth in sorted(hosts.items())
+                if machine != 'default' and auth[2]]
 
     def set_password(self, machine, username, password):
         """Implement AuthPlugin::set_password()."""
+        self.set_passwords([(machine, username, password)])
+
+    def set_passwords(self, credentials):
+        """Implement AuthPlugin::set_passwords(), one file rewrite."""
+        machines = {c[0].lower() for c in credentials}
 
         def is_matching_entry(line):
-            """Return True if line contains 'machine' machine'."""
+            """Return True if line contains 'machine <one of machines>'."""
             words = line.split(' ')
             for i in range(0, len(words) - 1):
                 if words[i] == 'machine' \
-                        and words[i + 1].lower() == machine.lower():
+                        and words[i + 1].lower() in machines:
                     return True
             return False
 
-        def new_entry():
+        def new_entry(machine, username, password):
             """Return new entry."""
             pw = base64.b64encode(password.encode('utf-8')).decode('ascii')
             line = 'machine ' + machine.lower()
@@ -66,11 +104,18 @@ class AuthNetrc(AuthPlugin):
 
         path = os.path.expanduser('~/.netrc')
         lines = []
-        if os.path.exists(path):
-            with open(path, 'r') as f:
-                lines = f.readlines()
-        lines = [line for line in lines if not is_matching_entry(line)]
-        lines.append(new_entry())
-        lines = [line.strip() + "\n" for line in lines]
-        with open(path, 'w') as f:
-            f.writelines(lines)
+        try:
+            if os.path.exists(path):
+                with open(path, 'r') as f:
+                    lines = f.readlines()
+            lines = [line for line in lines if not is_matching_entry(line)]
+            lines.extend([new_entry(*c) for c in credentials])
+            lines = [line.strip() + "\n" for line in lines]
+            fd, tmp_path = tempfile.mkstemp(
+                dir=os.path.dirname(path), prefix='.netrc.')
+            with os.fdopen(fd, 'w') as f:
+                f.writelines(lines)
+            os.replace(tmp_path, path)
+        except OSError as err:
+            raise AuthError("Cannot update %s: %s" % (path, err)) from None
+        _netrc_cache.pop(path, None)
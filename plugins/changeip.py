@@ -6,6 +6,8 @@ See:
  http://www.changeip.com/accounts/knowledgebase.php?action=displayarticle&id=34
 """
 
+from urllib.parse import urlparse
+
 from ddupdate.ddplugin import ServicePlugin, ServiceError
 from ddupdate.ddplugin import http_basic_auth_setup, get_response
 
@@ -31,6 +33,10 @@ class ChangeAddressPlugin(ServicePlugin):
     _oneliner = 'Updates on http://changeip.com/'
     _url = "https://nic.ChangeIP.com/nic/update?&hostname={0}"
 
+    def auth_machines(self, hostname, options):
+        """Implement ServicePlugin.auth_machines()."""
+        return [urlparse(self._url.format(hostname)).hostname]
+
     def register(self, log, hostname, ip, options):
         """Implement ServicePlugin.register."""
         url = self._url.format(hostname)
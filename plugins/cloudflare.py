@@ -15,9 +15,10 @@ Please install python-requests or python3-requests. Giving up.
 # pylint: disable=wrong-import-position
 from ddupdate.ddplugin import ServicePlugin, ServiceError
 from ddupdate.ddplugin import get_netrc_auth, dict_of_opts
+from ddupdate.ddplugin import read_plugin_cache, write_plugin_cache
 
 try:
-    from requests import Request, Session
+    from requests import Request, RequestException, Session
     from requests.auth import AuthBase
 except (ImportError, ModuleNotFoundError):
     import sys
@@ -25,45 +26,51 @@ except (ImportError, ModuleNotFoundError):
     sys.exit(1)
 
 
-def _call(session, request):
-    """Call Cloudflare V4 API."""
+_CACHE_NAME = 'cloudflare'
+TIMEOUT = 20            # Seconds to wait for the api
+_PAGE_SIZE = 1000       # Records per page when listing a zone
+_BATCH_SIZE = 100       # Max changes in each batch request
+
+# Shared by all calls, keeps connections open in long running processes.
+_session = Session()
+
+
+class _NotFoundError(ServiceError):
+    """Api returned 404, typically a stale cached id."""
+
+
+def _call_json(session, request):
+    """Call Cloudflare V4 API, return complete json reply."""
     try:
         prepped = session.prepare_request(request)
-        res = session.send(prepped)
+        res = session.send(prepped, timeout=TIMEOUT)
 
-        if res.status_code / 100 != 2:
+        if res.status_code == 404:
+            raise _NotFoundError("Not found: %s" % request.url)
+        if res.status_code // 100 != 2:
             raise ServiceError("Error retrieving %s: status %d" %
                                (request.url, res.status_code))
         json = res.json()
         if not json['success']:
             raise ServiceError("Error retrieving %s: errors %s" %
                                (request.url, json['errors']))
-        return json['result']
+        return json
     except ValueError as err:
         raise ServiceError("Error parsing response %s: %s" %
                            (request.url, err)) from None
+    except RequestException as err:
+        raise ServiceError("Error retrieving %s: %s" %
+                           (request.url, err)) from None
 
 
-def _get_ipv4_from_dnsrecords(dnsrecords):
-    """
-    Find the A record in dns records, and return tuple (id, address).
-    """
-    for rec in dnsrecords:
-        if 'type' in rec:
-            if rec['type'] == 'A':
-                return (rec['id'], rec['content'])
-    return (None, None)
+def _call(session, request):
+    """Call Cloudflare V4 API, return the result."""
+    return _call_json(session, request)['result']
 
 
-def _get_ipv6_from_dnsrecords(dnsrecords):
-    """
-    Find the AAAA record in dns records, and return tuple (id, address).
-    """
-    for rec in dnsrecords:
-        if 'type' in rec:
-            if rec['type'] == 'AAAA':
-                return (rec['id'], rec['content'])
-    return (None, None)
+def _record_key(hostname, rtype):
+    """Return key for a record in the zone cache."""
+    return hostname.lower() + ' ' + rtype
 
 
 class CloudflareAuth(AuthBase):
@@ -107,6 +114,14 @@ class CloudflarePlugin(ServicePlugin):
         machine api.cloudflare.com login <Token> password CloudflareApiToken
     Use "User Profile -> API Tokens -> Create Token -> Edit Zone DNS (Use
     template)" on Cloudflare site to generate token.
+
+    The zone and record ids are cached, so a normal update is a single
+    PATCH request. The cache is refreshed if Cloudflare reports an id
+    as not found.
+
+    When several configuration sections updates hosts in the same zone
+    all records in the zone are listed once, and the changed ones are
+    updated using batch requests.
     Options:
         zone = Cloudflare Zone name (mandatory)
     """
@@ -115,6 +130,8 @@ class CloudflarePlugin(ServicePlugin):
     _oneliner = 'Updates on https://cloudflare.com'
     _url = "https://api.cloudflare.com/client/v4"
     _auth = None
+    _partial_update = True
+    _batch_update = True
 
     def _get_zoneid(self, session, opts):
         """Retrieve an identifier for a given zone name."""
@@ -162,7 +179,7 @@ class CloudflarePlugin(ServicePlugin):
         """Update existing dns record."""
         zone_id = opts['zone_id']
         request = Request(
-            'PUT',
+            'PATCH',
             self._url + "/zones/{0}/dns_records/{1}".format(zone_id,
                                                             record_id),
             json=record,
@@ -175,69 +192,173 @@ class CloudflarePlugin(ServicePlugin):
         user, password = get_netrc_auth('api.cloudflare.com')
         self._auth = CloudflareAuth(user, password)
 
-    def register(self, log, hostname, ip, options):
-        """Implement ServicePlugin.register()."""
-        if not ip:
-            raise ServiceError("IP must be defined.")
-
-        self._init_auth()
-        opts = dict_of_opts(options)
-
-        if 'zone' not in opts:
-            raise ServiceError('Required option zone= missing, giving up.')
-
-        session = Session()
-
-        opts['zone_id'] = self._get_zoneid(session, opts)
-
-        dnsrecords = self._get_dnsrecords(session, hostname, opts)
-        ipv4_id, ipv4 = _get_ipv4_from_dnsrecords(dnsrecords)
-        ipv6_id, ipv6 = _get_ipv6_from_dnsrecords(dnsrecords)
-        log.debug("host=%s existing_ipv4=%s existing_ipv6=%s",
-                  hostname, ipv4, ipv6)
-
-        if ip.v4:
-            if ipv4 != ip.v4:
-                record = {
-                    'type': 'A',
-                    'name': hostname,
-                    'content': ip.v4
-                }
-                if ipv4_id:
-                    log.debug(
-                        "method=update_A host=%s existing=%s expected=%s",
-                        hostname, ipv4, ip.v4)
-                    ipv4_id, ipv4 = \
-                        self._update_dnsrecord(session, ipv4_id, record, opts)
-                else:
-                    log.debug(
-                        "method=create_A host=%s existing=%s expected=%s",
-                        hostname, ipv4, ip.v4)
-                    ipv4_id, ipv4 = \
+    def _get_zone_records(self, session, opts):
+        """Retrieve all A and AAAA records in zone, page by page."""
+        zone_id = opts['zone_id']
+        records = []
+        page = 1
+        while True:
+            request = Request(
+                'GET',
+                self._url + "/zones/{0}/dns_records".format(zone_id),
+                params={'page': page, 'per_page': _PAGE_SIZE},
+                auth=self._auth)
+            json = _call_json(session, request)
+            records.extend([r for r in json['result']
+                            if r.get('type') in ['A', 'AAAA']])
+            info = json.get('result_info') or {}
+            if not json['result'] or page >= info.get('total_pages', 1):
+                return records
+            page += 1
+
+    def _batch_dnsrecords(self, session, changes, opts):
+        """Apply dict with patches and posts lists, return changed records."""
+        zone_id = opts['zone_id']
+        request = Request(
+            'POST',
+            self._url + "/zones/{0}/dns_records/batch".format(zone_id),
+            json=changes,
+            auth=self._auth)
+        res = _call(session, request)
+        return (res.get('patches') or []) + (res.get('posts') or [])
+
+    @staticmethod
+    def _wanted_records(hostname, ip):
+        """Return list of (key, record) for addresses in ip."""
+        wanted = []
+        for rtype, address in [('A', ip.v4), ('AAAA', ip.v6)]:
+            if address:
+                record = {'type': rtype, 'name': hostname, 'content': address}
+                wanted.append((_record_key(hostname, rtype), record))
+        return wanted
+
+    def _update(self, log, session, zone, hosts, opts):
+        """
+        Update list of (hostname, ip) using ids in the zone cache entry.
+
+        Missing ids are looked up and added to the cache. Records are
+        updated directly if their id is cached, without checking the
+        current value.
+        """
+        records = zone.setdefault('records', {})
+        for hostname, ip in hosts:
+            wanted = self._wanted_records(hostname, ip)
+            fetched = []
+            if [k for k, r in wanted if k not in records]:
+                for rec in self._get_dnsrecords(session, hostname, opts):
+                    if rec.get('type') in ['A', 'AAAA']:
+                        key = _record_key(hostname, rec['type'])
+                        records[key] = \
+                            {'id': rec['id'], 'content': rec['content']}
+                        fetched.append(key)
+            for key, record in wanted:
+                rtype, address = record['type'], record['content']
+                cached = records.get(key)
+                if not cached:
+                    log.debug("method=create_%s host=%s expected=%s",
+                              rtype, hostname, address)
+                    record_id, content = \
                         self._create_dnsrecord(session, record, opts)
-                log.debug("ipv4_id=%s updated_ipv4=%s", ipv4_id, ipv4)
-            else:
-                log.info("Existing ipv4 record matches, skipping update")
-
-        if ip.v6:
-            if ipv6 != ip.v6:
-                record = {
-                    'type': 'AAAA',
-                    'name': hostname,
-                    'content': ip.v6
-                }
-                if ipv6_id:
-                    log.debug(
-                        "method=update_AAAA host=%s existing=%s expected=%s",
-                        hostname, ipv6, ip.v6)
-                    ipv6_id, ipv6 = \
-                        self._update_dnsrecord(session, ipv6_id, record, opts)
+                elif key in fetched and cached['content'] == address:
+                    log.info("Existing %s record matches, skipping update",
+                             rtype)
+                    continue
                 else:
                     log.debug(
-                        "method=create_AAAA host=%s existing=%s expected=%s",
-                        hostname, ipv6, ip.v6)
-                    ipv6_id, ipv6 = \
-                        self._create_dnsrecord(session, record, opts)
-                log.debug("ipv6_id=%s updated_ipv6=%s", ipv6_id, ipv6)
+                        "method=update_%s host=%s cached=%s expected=%s",
+                        rtype, hostname, cached['content'], address)
+                    record_id, content = self._update_dnsrecord(
+                        session, cached['id'], record, opts)
+                records[key] = {'id': record_id, 'content': content}
+                log.debug("%s_id=%s updated=%s", rtype, record_id, content)
+
+    def _reconcile(self, log, session, zone, hosts, opts):
+        """
+        Update list of (hostname, ip) using a zone listing and batches.
+
+        The zone cache entry is refreshed from the listing.
+        """
+        records = {}
+        for rec in self._get_zone_records(session, opts):
+            records[_record_key(rec['name'], rec['type'])] = \
+                {'id': rec['id'], 'content': rec['content']}
+        zone['records'] = records
+        changes = []
+        for hostname, ip in hosts:
+            for key, record in self._wanted_records(hostname, ip):
+                if key not in records:
+                    changes.append(('posts', record))
+                elif records[key]['content'] != record['content']:
+                    record['id'] = records[key]['id']
+                    changes.append(('patches', record))
+        log.info("Zone %s: %d of %d host(s) needs %d record change(s)",
+                 opts['zone'], len({r['name'] for k, r in changes}),
+                 len(hosts), len(changes))
+        for start in range(0, len(changes), _BATCH_SIZE):
+            batch = {'patches': [], 'posts': []}
+            for kind, record in changes[start:start + _BATCH_SIZE]:
+                batch[kind].append(record)
+            for rec in self._batch_dnsrecords(session, batch, opts):
+                records[_record_key(rec['name'], rec['type'])] = \
+                    {'id': rec['id'], 'content': rec['content']}
+
+    def _update_zone(self, log, session, zones, hosts, opts):
+        """Update list of (hostname, ip) in zone opts['zone']."""
+        update = self._update if len(hosts) == 1 else self._reconcile
+        for retry in [False, True]:
+            zone = zones.setdefault(opts['zone'], {})
+            try:
+                if 'id' not in zone:
+                    zone['id'] = self._get_zoneid(session, opts)
+                    zone['records'] = {}
+                opts['zone_id'] = zone['id']
+                update(log, session, zone, hosts, opts)
+                return
+            except _NotFoundError as err:
+                if retry:
+                    raise
+                log.debug("Dropping cached ids: %s", err)
+                zones[opts['zone']] = {}
+
+    def auth_machines(self, hostname, options):
+        """Implement ServicePlugin.auth_machines()."""
+        return ['api.cloudflare.com']
+
+    def register(self, log, hostname, ip, options):
+        """Implement ServicePlugin.register()."""
+        err = self.register_batch(log, [(hostname, ip, options)])[0]
+        if err:
+            raise err
+
+    def register_batch(self, log, updates):
+        """Implement ServicePlugin.register_batch()."""
+        results = [None] * len(updates)
+        by_zone = {}
+        for i, (hostname, ip, options) in enumerate(updates):
+            opts = dict_of_opts(options)
+            if not ip:
+                results[i] = ServiceError("IP must be defined.")
+            elif 'zone' not in opts:
+                results[i] = ServiceError(
+                    'Required option zone= missing, giving up.')
             else:
-                log.info("Existing ipv6 record matches, skipping update")
+                by_zone.setdefault(opts['zone'], []).append(i)
+        if not by_zone:
+            return results
+
+        self._init_auth()
+        cache = read_plugin_cache(_CACHE_NAME)
+        zones = cache.setdefault('zones', {})
+        for zone, indexes in by_zone.items():
+            hosts = [updates[i][0:2] for i in indexes]
+            try:
+                self._update_zone(
+                    log, _session, zones, hosts, {'zone': zone})
+            except ServiceError as err:
+                for i in indexes:
+                    results[i] = err
+        try:
+            write_plugin_cache(_CACHE_NAME, cache)
+        except OSError as err:
+            log.warning("Cannot save Cloudflare id cache: %s", err)
+        return results
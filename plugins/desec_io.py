@@ -30,6 +30,10 @@ class DesecPlugin(ServicePlugin):
     _oneliner = 'Updates on http://desec.io/'
     _url = "https://update.dedyn.io/?hostname={0}"
 
+    def auth_machines(self, hostname, options):
+        """Implement ServicePlugin.auth_machines()."""
+        return [hostname]
+
     def register(self, log, hostname, ip, options):
         """Implement ServicePlugin.register()."""
         url = self._url.format(hostname)
@@ -34,6 +34,10 @@ class DnsOMaticPlugin(ServicePlugin):
     _oneliner = 'Updates on http://dnsomatic.com'
     _url = 'https://updates.dnsomatic.com/nic/update?hostname={0}'
 
+    def auth_machines(self, hostname, options):
+        """Implement ServicePlugin.auth_machines()."""
+        return [urlparse(self._url.format(hostname)).hostname]
+
     def register(self, log, hostname, ip, options):
         """Implement ServicePlugin.register()."""
         url = self._url.format(hostname)
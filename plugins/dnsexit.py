@@ -39,6 +39,10 @@ class DnsexitPlugin(ServicePlugin):
     _ip_warning = \
         "service is not known to provide an address, use another ip plugin"
 
+    def auth_machines(self, hostname, options):
+        """Implement ServicePlugin.auth_machines()."""
+        return ['update.dnsexit.com']
+
     def register(self, log, hostname, ip, options):
         """Implement AddressPlugin.get_ip()."""
         if not ip:
@@ -8,6 +8,8 @@ See: https://www.dnshome.de/
 from typing import AnyStr
 from logging import Logger
 
+from urllib.parse import urlparse
+
 from ddupdate.ddplugin import ServicePlugin, ServiceError
 from ddupdate.ddplugin import http_basic_auth_setup, get_response, IpAddr
 
@@ -51,6 +53,10 @@ class DeDnsHomeAddressPlugin(ServicePlugin):
         """
         return response.startswith('good') or response.startswith('nochg')
 
+    def auth_machines(self, hostname, options):
+        """Implement ServicePlugin.auth_machines()."""
+        return [urlparse(self._url.format(hostname)).hostname]
+
     def register(self, log: Logger, hostname: str, ip: IpAddr, options):
         """Implement ServicePlugin.register.
 
@@ -7,6 +7,8 @@ See: https://dnspark.zendesk.com/hc/en-us/articles/
         216322723-Dynamic-DNS-API-Documentation
 """
 
+from urllib.parse import urlparse
+
 from ddupdate.ddplugin import ServicePlugin, ServiceError
 from ddupdate.ddplugin import http_basic_auth_setup, get_response
 
@@ -35,6 +37,10 @@ class DnsparkPlugin(ServicePlugin):
     _oneliner = 'Updates on https://dnspark.com/'
     _url = "https://control.dnspark.com/api/dynamic/update.php?hostname={0}"
 
+    def auth_machines(self, hostname, options):
+        """Implement ServicePlugin.auth_machines()."""
+        return [urlparse(self._url.format(hostname)).hostname]
+
     def register(self, log, hostname, ip, options):
         """Implement ServicePlugin.register()."""
         url = self._url.format(hostname)
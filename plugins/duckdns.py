@@ -31,6 +31,10 @@ class DuckdnsPlugin(ServicePlugin):
     _oneliner = 'Updates on http://duckdns.org'
     _url = "https://www.duckdns.org/update?domains={0}&token={1}"
 
+    def auth_machines(self, hostname, options):
+        """Implement ServicePlugin.auth_machines()."""
+        return ['www.duckdns.org']
+
     def register(self, log, hostname, ip, options):
         """Implement ServicePlugin.register()."""
         password = get_netrc_auth('www.duckdns.org')[1]
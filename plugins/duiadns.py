@@ -27,6 +27,9 @@ except (ImportError, ModuleNotFoundError):
     sys.exit(1)
 
 
+TIMEOUT = 20
+
+
 def error(message):
     """Just a shorthand."""
     raise ServiceError("HTML parser error: " + message)
@@ -83,6 +86,10 @@ class DuiadnsPlugin(ServicePlugin):
     _oneliner = 'Updates on https://www.duiadns.net'
     _url = 'https://ip.duiadns.net/dynamic.duia?host={0}&password={1}'
 
+    def auth_machines(self, hostname, options):
+        """Implement ServicePlugin.auth_machines()."""
+        return ['ip.duiadns.net']
+
     def register(self, log, hostname, ip, options):
         """Implement ServicePlugin.register()."""
         password = get_netrc_auth('ip.duiadns.net')[1]
@@ -96,7 +103,11 @@ class DuiadnsPlugin(ServicePlugin):
         try:
             html = get_response(log, url)
         except ServiceError:
-            resp = requests.get(url, verify=False)
+            try:
+                resp = requests.get(url, verify=False, timeout=TIMEOUT)
+            except requests.RequestException as err:
+                raise ServiceError("Cannot access update url: %s" % err) \
+                    from None
             if resp.status_code != 200:
                 raise ServiceError("Cannot access update url: " + url) \
                     from None
@@ -6,6 +6,8 @@ See: https://www.dy.fi/page/specification
 
 """
 
+from urllib.parse import urlparse
+
 from ddupdate.ddplugin import ServicePlugin, ServiceError
 from ddupdate.ddplugin import http_basic_auth_setup, get_response
 
@@ -29,6 +31,10 @@ class DyFiPlugin(ServicePlugin):
     _url = 'https://www.dy.fi/nic/update?hostname={0}'
     _ip_cache_ttl = 7200  # 5 days
 
+    def auth_machines(self, hostname, options):
+        """Implement ServicePlugin.auth_machines()."""
+        return [urlparse(self._url.format(hostname)).hostname]
+
     def register(self, log, hostname, ip, options):
         """Implement ServicePlugin.register."""
         url = self._url.format(hostname)
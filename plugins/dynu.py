@@ -32,6 +32,10 @@ class DynuPlugin(ServicePlugin):
     _oneliner = 'Updates on https://www.dynu.com/en-US/DynamicDNS'
     _url = "https://api.dynu.com/nic/update?host={0}"
 
+    def auth_machines(self, hostname, options):
+        """Implement ServicePlugin.auth_machines()."""
+        return [urlparse(self._url.format(hostname)).hostname]
+
     def register(self, log, hostname, ip, options):
         """Implement ServicePlugin.register()."""
         url = self._url.format(hostname)
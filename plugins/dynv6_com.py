@@ -33,6 +33,10 @@ class Dynv6Plugin(ServicePlugin):
     _oneliner = 'Updates on http://dynv6.com'
     _url = "https://dynv6.com/api/update?"
 
+    def auth_machines(self, hostname, options):
+        """Implement ServicePlugin.auth_machines()."""
+        return ['dynv6.com']
+
     def register(self, log, hostname, ip, options):
         """Implement ServicePlugin.register()."""
         password = get_netrc_auth('dynv6.com')[1]
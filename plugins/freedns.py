@@ -27,6 +27,10 @@ class FreednsPlugin(ServicePlugin):
     _oneliner = 'Updates on https://freedns.afraid.org'
     _url = 'https://sync.afraid.org/u/?u={0}&p={1}&h={2}'
 
+    def auth_machines(self, hostname, options):
+        """Implement ServicePlugin.auth_machines()."""
+        return ['freedns.afraid.org']
+
     def register(self, log, hostname, ip, options):
         """
         Based on http://freedns.afraid.org/api/, needs _url below  to update.
@@ -33,6 +33,10 @@ class FreednsIoPlugin(ServicePlugin):
     _oneliner = 'Updates on https://freedns.io'
     _url = 'https://freedns.io/request'
 
+    def auth_machines(self, hostname, options):
+        """Implement ServicePlugin.auth_machines()."""
+        return ['freedns.io']
+
     def register(self, log, hostname, ip, options):
         """Implement ServicePlugin.register."""
         user, password = get_netrc_auth('freedns.io')
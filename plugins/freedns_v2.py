@@ -40,6 +40,10 @@ class FreednsV2Plugin(ServicePlugin):
     _oneliner = 'Updates on https://sync.afraid.org/u/{API-v2-token}/'
     _url = 'https://{0}sync.afraid.org/u/{1}/'
 
+    def auth_machines(self, hostname, options):
+        """Implement ServicePlugin.auth_machines()."""
+        return [hostname + '@sync.afraid.org']
+
     def register(self, log, hostname, ip, options):
         """
         Based on  https://freedns.afraid.org/dynamic/v2/, needs _url below
@@ -88,6 +88,11 @@ class GoogleDomainsPlugin(ServicePlugin):
     _oneliner = "Updates on https://domains.google.com"
     _url = "https://domains.google.com/nic/update"
 
+    def auth_machines(self, hostname, options):
+        """Implement ServicePlugin.auth_machines()."""
+        provider = urllib.parse.urlparse(self._url).hostname
+        return ["%s.%s.ddupdate" % (hostname, provider), provider]
+
     def register(self, log, hostname, ip, options):
         """Implement ServicePlugin.register()."""
         query = {
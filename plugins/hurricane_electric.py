@@ -33,6 +33,10 @@ class FreednsIoPlugin(ServicePlugin):
     _oneliner = 'Updates on https://he.com'
     _url = 'https://dyn.dns.he.net/nic/update'
 
+    def auth_machines(self, hostname, options):
+        """Implement ServicePlugin.auth_machines()."""
+        return [hostname]
+
     def register(self, log, hostname, ip, options):
         """Implement ServicePlugin.register."""
         password = get_netrc_auth(hostname)[1]
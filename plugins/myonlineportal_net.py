@@ -33,6 +33,10 @@ class MyOnlinePortalPlugin(ServicePlugin):
     _oneliner = 'Updates on http://myonlineportal.net/'
     _url = 'https://myonlineportal.net/updateddns?hostname={0}'
 
+    def auth_machines(self, hostname, options):
+        """Implement ServicePlugin.auth_machines()."""
+        return [urlparse(self._url.format(hostname)).hostname]
+
     def register(self, log, hostname, ip, options):
         """Implement ServicePlugin.register()."""
         url = self._url.format(hostname)
@@ -40,6 +40,10 @@ class NamecheapPlugin(ServicePlugin):
             **{e.tag: self._etree_to_dict(e) for e in t}
         }
 
+    def auth_machines(self, hostname, options):
+        """Implement ServicePlugin.auth_machines()."""
+        return [self._name]
+
     def register(self, log, hostname, ip, options):
         """Implement ServicePlugin.register()."""
 
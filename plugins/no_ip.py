@@ -5,6 +5,8 @@ See: ddupdate(8)
 See: https://www.noip.com/integrate/request
 """
 
+from urllib.parse import urlparse
+
 from ddupdate.ddplugin import ServicePlugin
 from ddupdate.ddplugin import http_basic_auth_setup, get_response
 
@@ -27,6 +29,10 @@ class NoAddressPlugin(ServicePlugin):
     _oneliner = 'Updates on http://no-ip.com/'
     _url = "http://dynupdate.no-ip.com/nic/update?hostname={0}"
 
+    def auth_machines(self, hostname, options):
+        """Implement ServicePlugin.auth_machines()."""
+        return [urlparse(self._url.format(hostname)).hostname]
+
     def register(self, log, hostname, ip, options):
         """Implement ServicePlugin.register()."""
         url = self._url.format(hostname)
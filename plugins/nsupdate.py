@@ -1,58 +1,179 @@
 """
-ddupdate plugin using nsupdate.
+ddupdate plugin using RFC 2136 dynamic updates, like nsupdate.
 
 See: ddupdate(8)
-See: nsupdate(1)
+See: nsupdate(1), RFC 2136, RFC 8945
 """
 
-from subprocess import Popen, PIPE
-import sys
-
 from ddupdate.ddplugin import ServicePlugin, ServiceError, dict_of_opts
+from ddupdate import dnswire
+
+TIMEOUT = 10
+TTL = 60
+
+
+def find_zone(hostname, server, timeout):
+    """Return the zone holding hostname, as reported by server."""
+    msg = dnswire.make_query(hostname, dnswire.TYPE_SOA, recursion=False)
+    reply = dnswire.exchange(msg, server, timeout)
+    for record in reply.answers + reply.authority:
+        if record.rtype == dnswire.TYPE_SOA:
+            return record.name
+    raise dnswire.DnsError("Cannot find zone for %s on %s (%s)"
+                           % (hostname, server, reply.rcode_text()))
+
+
+def current_records(hostname, rtype, server, timeout):
+    """Return list of rtype records for hostname on server."""
+    msg = dnswire.make_query(hostname, rtype, recursion=False)
+    reply = dnswire.exchange(msg, server, timeout)
+    if reply.rcode not in [0, 3]:
+        raise dnswire.DnsError("Cannot query %s for %s: %s"
+                               % (server, hostname, reply.rcode_text()))
+    name = dnswire.canonical_name(hostname)
+    return [r for r in reply.answers
+            if r.rtype == rtype and dnswire.canonical_name(r.name) == name]
+
+
+def make_update(zone, hosts, settings):
+    """
+    Return an UPDATE message for (hostname, ip) tuples in hosts.
+
+    If settings['conditional'] is set, the existing records are first
+    queried. Records already correct are left alone, the others are
+    guarded by a prerequisite (RFC 2136, 2.4) requiring the records
+    to be unchanged when the server applies the update.
+    """
+    msg = dnswire.make_update(zone)
+    for hostname, ip in hosts:
+        for address in [ip.v4, ip.v6] if ip else []:
+            if not address:
+                continue
+            rtype, rdata = dnswire.address_rdata(address)
+            if settings['conditional']:
+                existing = current_records(hostname, rtype,
+                                           settings['server'],
+                                           settings['timeout'])
+                if [(r.rdata, r.ttl) for r in existing] \
+                        == [(rdata, settings['ttl'])]:
+                    continue
+                for record in existing:
+                    msg.answers.append(dnswire.Record(
+                        hostname, rtype, dnswire.CLASS_IN, 0, record.rdata))
+                if not existing:
+                    msg.answers.append(dnswire.Record(
+                        hostname, rtype, dnswire.CLASS_NONE, 0, b''))
+            msg.authority.append(dnswire.delete_rrset(hostname, rtype))
+            msg.authority.append(dnswire.Record(
+                hostname, rtype, dnswire.CLASS_IN, settings['ttl'], rdata))
+    return msg
+
+
+def send_update(log, zone, key, hosts, settings):
+    """
+    Update all (hostname, ip) in hosts using a single message.
+
+    Parameters:
+      - zone: string, the zone holding all hosts.
+      - key: dnswire.TsigKey or None.
+      - hosts: list of (hostname, IpAddr) tuples.
+      - settings: dict with server, timeout, ttl and conditional.
+    Raises:
+      - dnswire.DnsError on errors.
+
+    """
+    server = settings['server']
+    for retry in [False, True]:
+        msg = make_update(zone, hosts, settings)
+        if not msg.authority:
+            log.info("All records in zone %s are up to date", zone)
+            return
+        log.debug("Sending %d update record(s) for zone %s to %s",
+                  len(msg.authority), zone, server)
+        wire, mac = key.sign(msg) if key else (None, None)
+        reply = dnswire.exchange(msg, server, settings['timeout'], wire=wire)
+        if key and (reply.tsig_offset is not None or reply.rcode == 0):
+            key.verify(reply, mac)
+        if reply.rcode_text() in ['NXRRSET', 'YXRRSET'] and not retry:
+            log.debug("Records changed on server, retrying")
+            continue
+        if reply.rcode != 0:
+            raise dnswire.DnsError(
+                "Update refused by %s: %s" % (server, reply.rcode_text()))
+        return
 
 
 class NsupdatePlugin(ServicePlugin):
     """
-    Update a dns entry with nsupdate(1).
+    Update dns entries using RFC 2136 dynamic updates.
+
+    The updates are sent directly to the server, like nsupdate(1) does,
+    optionally signed using a TSIG key. Hosts in all configuration
+    sections using the same server, zone and key are updated using
+    a single message.
 
-    Options (see manpage):
-        server
-        key
-        zone
+    Options:
+        server=host[:port]      Server to update, mandatory.
+        key=path                TSIG key file as used by nsupdate -k,
+                                either a key statement as created by
+                                tsig-keygen or a K*.private file.
+        zone=zone               Zone to update, by default asked from
+                                the server.
+        timeout=seconds         Timeout for server reply, default 10.
+        ttl=seconds             TTL of updated records, default 60.
+        conditional             Only update records which differs from
+                                the wanted ones, avoiding needless zone
+                                serial changes. Uses a query for each
+                                record before the update.
     """
 
     _name = 'nsupdate'
     _oneliner = 'Update address via nsupdate'
+    _partial_update = True
+    _batch_update = True
 
     def register(self, log, hostname, ip, options):
         """Implement ServicePlugin.register."""
-        opts = dict_of_opts(options)
-        log.debug(opts)
-        if 'server' not in opts:
-            log.error("Required server option missing, giving up")
-            sys.exit(2)
-        args = ('nsupdate',)
-        if 'key' in opts:
-            args += ('-k', opts['key'].encode('ascii'))
-        with Popen(args, stdout=PIPE, stdin=PIPE, stderr=PIPE) as p:
-            p.stdin.write(b'server ' + opts['server'].encode('ascii') + b'\n')
+        err = self.register_batch(log, [(hostname, ip, options)])[0]
+        if err:
+            raise err
+
+    def register_batch(self, log, updates):
+        """Implement ServicePlugin.register_batch()."""
+        results = [None] * len(updates)
+        batches = {}
+        for i, (hostname, _, options) in enumerate(updates):
+            opts = dict_of_opts(options)
+            log.debug(opts)
+            try:
+                if 'server' not in opts:
+                    raise ServiceError(
+                        "Required server option missing, giving up")
+                timeout = float(opts.get('timeout', TIMEOUT))
+                ttl = int(opts.get('ttl', TTL))
+                zone = opts['zone'] if 'zone' in opts \
+                    else find_zone(hostname, opts['server'], timeout)
+            except ValueError:
+                results[i] = ServiceError("Bad timeout or ttl option")
+                continue
+            except ServiceError as err:
+                results[i] = err
+                continue
+            except dnswire.DnsError as err:
+                results[i] = ServiceError(str(err))
+                continue
+            batch = (dnswire.canonical_name(zone), opts.get('key'),
+                     opts['server'], timeout, ttl, 'conditional' in opts)
+            batches.setdefault(batch, []).append(i)
+        for batch, indexes in batches.items():
+            zone, keyfile = batch[0:2]
+            settings = dict(zip(['server', 'timeout', 'ttl', 'conditional'],
+                                batch[2:]))
+            hosts = [updates[i][0:2] for i in indexes]
             try:
-                p.stdin.write(b'zone ' + opts['zone'].encode('ascii') + b'\n')
-            except KeyError:
-                pass
-            hostname = hostname.encode('ascii')
-            if ip:
-                if ip.v4:
-                    addr = ip.v4.encode('ascii')
-                    p.stdin.write(b'update delete ' + hostname + b' A\n')
-                    p.stdin.write(
-                        b'update add ' + hostname + b' 60 A ' + addr + b'\n')
-                if ip.v6:
-                    addr = ip.v6.encode('ascii')
-                    p.stdin.write(b'update delete ' + hostname + b' AAAA\n')
-                    p.stdin.write(b'update add ' + hostname
-                                  + b' 60 AAAA ' + addr + b'\n')
-            p.stdin.write(b'send\n')
-            err = p.communicate()[1]
-        if len(err) > 0:
-            raise ServiceError("Bad update reply: " + err.decode('ascii'))
+                key = dnswire.TsigKey.from_file(keyfile) if keyfile else None
+                send_update(log, zone, key, hosts, settings)
+            except dnswire.DnsError as err:
+                for i in indexes:
+                    results[i] = ServiceError(str(err))
+        return results
@@ -0,0 +1,59 @@
+"""Tests for the STUN response parser in plugins/addr_stun.py."""
+
+import importlib.util
+import os.path
+import struct
+import sys
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'lib'))
+
+_spec = importlib.util.spec_from_file_location(
+    'addr_stun', os.path.join(HERE, '..', 'plugins', 'addr_stun.py'))
+addr_stun = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(addr_stun)
+
+_TID = b'0123456789ab'
+
+
+def _response(attr_type, value):
+    """Return a binding response holding a single attribute."""
+    attr = struct.pack('!HH', attr_type, len(value)) + value
+    attr += b'\0' * (-len(value) % 4)
+    return struct.pack('!HHI', 0x0101, len(attr), 0x2112A442) + _TID + attr
+
+
+class ParseResponseTest(unittest.TestCase):
+    """Test parse_response()."""
+
+    def test_mapped_address(self):
+        """A plain MAPPED-ADDRESS is decoded."""
+        value = struct.pack('!BBH', 0, 1, 1234) + bytes([192, 0, 2, 1])
+        data = _response(0x0001, value)
+        self.assertEqual(addr_stun.parse_response(data, _TID), '192.0.2.1')
+
+    def test_xor_mapped_address(self):
+        """A XOR-MAPPED-ADDRESS is decoded using the magic cookie."""
+        addr = bytes(a ^ b for a, b in zip([192, 0, 2, 1],
+                                           [0x21, 0x12, 0xA4, 0x42]))
+        value = struct.pack('!BBH', 0, 1, 1234) + addr
+        data = _response(0x0020, value)
+        self.assertEqual(addr_stun.parse_response(data, _TID), '192.0.2.1')
+
+    def test_truncated_attribute(self):
+        """Truncated address attributes are ignored, not raising."""
+        for attr_type in [0x0001, 0x0020, 0x8020]:
+            for value in [b'', b'\0', b'\0\x01\0', b'\0\x01\0\0\xc0']:
+                data = _response(attr_type, value)
+                self.assertIsNone(addr_stun.parse_response(data, _TID))
+
+    def test_bad_family_length(self):
+        """An ipv6 family with an ipv4 sized address is ignored."""
+        value = struct.pack('!BBH', 0, 2, 1234) + bytes([192, 0, 2, 1])
+        data = _response(0x0001, value)
+        self.assertIsNone(addr_stun.parse_response(data, _TID))
+
+
+if __name__ == '__main__':
+    unittest.main()